@@ -1,18 +1,32 @@
 import sys
+import os
 import math
+import shutil
 import sqlite3
 import json
 import copy
+import csv
+import hashlib
+import struct
+import tempfile
+import time
+import zlib
+from collections import Counter, namedtuple
+from array import array
 from datetime import datetime
 from PyQt6.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, 
                              QHBoxLayout, QLabel, QLineEdit, QComboBox, 
                              QPushButton, QListWidget, QGraphicsScene, 
                              QGraphicsView, QGraphicsItem, QGraphicsEllipseItem, 
                              QGraphicsPathItem, QGraphicsTextItem, QMessageBox,
-                             QFileDialog, QFrame, QSplitter)
-from PyQt6.QtCore import Qt, QPointF, QRectF, QLineF, pyqtSignal, QObject
+                             QFileDialog, QFrame, QSplitter, QCheckBox,
+                             QInputDialog, QDialog, QTableWidget, QTableWidgetItem,
+                             QHeaderView, QProgressDialog, QProgressBar)
+from PyQt6.QtCore import (Qt, QPointF, QRectF, QLineF, pyqtSignal, QObject, QThread, QTimer,
+                          QMimeData, QUrl)
 from PyQt6.QtGui import (QPen, QBrush, QColor, QPainter, QPainterPath, 
-                         QFont, QPolygonF, QTransform, QImage)
+                         QFont, QPolygonF, QTransform, QImage, QStaticText, QShortcut,
+                         QKeySequence, QDrag, QFontMetricsF)
 
 # --- 설정 및 상수 (디자인 테마) ---
 CONSTANTS = {
@@ -25,8 +39,492 @@ CONSTANTS = {
     'CARD_BG': '#ffffff',
     'NODE_RADIUS': 40,
     'FONT_FAMILY': 'Malgun Gothic', # 윈도우 기본 한글 폰트
+    'SCREEN_DPI': 96,               # 배율 1배에 해당하는 DPI
+    'EXPORT_DPI': 96,               # 이미지 저장 기본 DPI
+    'EXPORT_STRIP_BYTES': 8 * 1024 * 1024, # 이미지 저장 시 한 번에 그리는 띠(strip) 최대 크기
+    'RENAME_DEBOUNCE_MS': 600,      # 이름 입력이 멈춘 뒤 히스토리에 기록하기까지의 시간
+    'UNDO_MERGE_SECONDS': 2.0,      # 같은 종류의 연속 편집을 하나의 실행 취소 단위로 합치는 시간
+    'NUDGE_STEP': 5,                # 방향키 이동 거리 (Shift: 4배)
+    'PROGRESSIVE_LOAD_MIN': 300,    # 주변 인물이 이보다 많으면 나눠서 화면에 추가
+    'LOAD_SLICE_MS': 15,            # 이벤트 루프 한 번에 아이템을 추가하는 최대 시간
+    'LOAD_FETCH_ROWS': 500,         # DB에서 한 번에 가져오는 행 수
+    'AUTOSAVE_SECONDS': 60,         # 자동 저장 간격 (바뀐 내용이 있을 때만 저장)
 }
 
+# --- 캔버스 테마 (노드/링크 색상과 선 굵기) ---
+THEMES = {
+    'default': {
+        'label': "기본",
+        'canvas': '#ffffff',
+        'node_fill': '#ffffff',
+        'person': CONSTANTS['TEXT_COLOR'],
+        'client': CONSTANTS['PRIMARY_COLOR'],
+        'selected': CONSTANTS['DANGER_COLOR'],
+        'text': CONSTANTS['TEXT_COLOR'],
+        'good': CONSTANTS['SUCCESS_COLOR'],
+        'distant': CONSTANTS['SECONDARY_COLOR'],
+        'conflict': CONSTANTS['DANGER_COLOR'],
+        'line_width': 2, # 인물 테두리·링크 굵기 (Client +1, 선택 +2)
+    },
+    'print': { # 흑백 인쇄용 (관계는 선 모양으로 구분)
+        'label': "인쇄용 (흑백)",
+        'canvas': '#ffffff',
+        'node_fill': '#ffffff',
+        'person': '#000000',
+        'client': '#000000',
+        'selected': '#777777',
+        'text': '#000000',
+        'good': '#000000',
+        'distant': '#000000',
+        'conflict': '#000000',
+        'line_width': 2,
+    },
+    'high_contrast': {
+        'label': "고대비",
+        'canvas': '#000000',
+        'node_fill': '#000000',
+        'person': '#ffffff',
+        'client': '#00ffff',
+        'selected': '#ff00ff',
+        'text': '#ffffff',
+        'good': '#00ff00',
+        'distant': '#ffff00',
+        'conflict': '#ff4040',
+        'line_width': 3,
+    },
+}
+
+# --- 관계/방향 코드 (스냅샷에서는 문자열 대신 작은 정수로 저장) ---
+RELATIONSHIPS = ('good', 'distant', 'conflict')
+DIRECTIONS = ('both', 'from', 'to')
+REL_CODES = {rel: i for i, rel in enumerate(RELATIONSHIPS)}
+DIR_CODES = {d: i for i, d in enumerate(DIRECTIONS)}
+
+# --- 공유 문자열 테이블 (이름을 한 번만 저장하고 번호로 참조) ---
+class StringTable:
+    def __init__(self):
+        self.strings = []
+        self.index = {}
+
+    def intern(self, text):
+        idx = self.index.get(text)
+        if idx is None:
+            idx = len(self.strings)
+            self.strings.append(text)
+            self.index[text] = idx
+        return idx
+
+    def __getitem__(self, idx):
+        return self.strings[idx]
+
+NAME_TABLE = StringTable()
+
+# --- 생태도 상태 스냅샷 (Undo/Redo 히스토리 및 DB 저장/불러오기 공용) ---
+# coords: [client_x, client_y, x1, y1, x2, y2, ...] (array('d'))
+# names: 주변 인물 이름 번호 (array('I'), NAME_TABLE 참조)
+# relationships / directions: 관계·방향 코드 (bytes)
+# 직전 스냅샷과 내용이 같은 배열은 새로 만들지 않고 그대로 공유합니다.
+class MapSnapshot:
+    __slots__ = ('client_name', 'coords', 'names', 'relationships', 'directions', 'digest')
+
+    def __init__(self, client_name, coords, names, relationships, directions):
+        self.client_name = client_name
+        self.coords = coords
+        self.names = names
+        self.relationships = relationships
+        self.directions = directions
+        self.digest = None # content_hash() 결과 캐시 (스냅샷은 만든 뒤 바뀌지 않음)
+
+    @classmethod
+    def build(cls, client_name, client_x, client_y, people, previous=None):
+        # people: (name, x, y, relationship, direction) 튜플의 반복자
+        coords = array('d', (client_x, client_y))
+        names = array('I')
+        rels = bytearray()
+        dirs = bytearray()
+        for name, x, y, rel, direction in people:
+            coords.append(x)
+            coords.append(y)
+            names.append(NAME_TABLE.intern(name))
+            rels.append(REL_CODES[rel])
+            dirs.append(DIR_CODES[direction])
+
+        snapshot = cls(NAME_TABLE.intern(client_name), coords, names, bytes(rels), bytes(dirs))
+        if previous is not None:
+            snapshot.share_with(previous)
+        return snapshot
+
+    def share_with(self, previous):
+        # 바뀌지 않은 부분은 이전 스냅샷의 객체를 재사용 (구조 공유)
+        if self.coords == previous.coords:
+            self.coords = previous.coords
+        if self.names == previous.names:
+            self.names = previous.names
+        if self.relationships == previous.relationships:
+            self.relationships = previous.relationships
+        if self.directions == previous.directions:
+            self.directions = previous.directions
+
+    def __len__(self):
+        return len(self.names)
+
+    def __eq__(self, other):
+        if not isinstance(other, MapSnapshot):
+            return NotImplemented
+        return (self.client_name == other.client_name and self.coords == other.coords and
+                self.names == other.names and self.relationships == other.relationships and
+                self.directions == other.directions)
+
+    def content_hash(self):
+        # 내용 비교용 해시 (이름은 같은 프로세스 안에서만 유효한 번호로 계산)
+        if self.digest is None:
+            h = hashlib.blake2b(digest_size=16)
+            h.update(struct.pack('<II', self.client_name, len(self.names)))
+            h.update(self.coords.tobytes())
+            h.update(self.names.tobytes())
+            h.update(self.relationships)
+            h.update(self.directions)
+            self.digest = h.digest()
+        return self.digest
+
+    def moved_since(self, other):
+        # 좌표만 바뀌었으면 바뀐 노드의 (번호, x, y) 목록 (0: Client, 1~: 주변 인물 순서)
+        # 이름·관계·방향·인원이 바뀌었으면 None
+        if (self.client_name != other.client_name or self.names != other.names or
+                self.relationships != other.relationships or self.directions != other.directions):
+            return None
+        coords, old = self.coords, other.coords
+        if coords is old:
+            return []
+        return [(i, coords[2*i], coords[2*i + 1]) for i in range(len(coords) // 2)
+                if coords[2*i] != old[2*i] or coords[2*i + 1] != old[2*i + 1]]
+
+    @property
+    def client(self):
+        return NAME_TABLE[self.client_name], self.coords[0], self.coords[1]
+
+    def iter_people(self):
+        coords = self.coords
+        for i, name_idx in enumerate(self.names):
+            yield (NAME_TABLE[name_idx], coords[2*i + 2], coords[2*i + 3],
+                   RELATIONSHIPS[self.relationships[i]], DIRECTIONS[self.directions[i]])
+
+# --- Undo/Redo 히스토리 항목 ---
+# kind/key가 같은 연속 편집(이름 입력, 방향키 이동, 같은 노드 드래그)은 시간 내에 하나로 합침
+HistoryEntry = namedtuple('HistoryEntry', ['state', 'kind', 'key', 'time'])
+MERGEABLE_EDITS = ('rename', 'nudge', 'move')
+
+# --- .ecomap 파일 (생태도 한 개를 담는 이식용 바이너리 파일) ---
+# 모든 값은 little-endian. 노드 표는 MapSnapshot과 같은 열(column) 배치라서
+# 읽을 때 필드를 하나씩 해석하지 않고 구역 단위로 배열에 그대로 복사합니다.
+#   헤더       ECOMAP_HEADER (매직, 버전, 예약, 주변 인물 수 n, 문자열 수 m, 문자열 바이트 수, Client 이름 번호)
+#   좌표       float64 x 2(n+1)  [Client x, y, 인물1 x, y, ...]
+#   이름       uint32 x n        (문자열 표 번호)
+#   관계/방향  uint8 x n, uint8 x n (RELATIONSHIPS/DIRECTIONS 순서의 코드)
+#   문자열 표  uint32 x (m+1) 시작 위치 + UTF-8 바이트
+ECOMAP_MAGIC = b'ECMP'
+ECOMAP_VERSION = 1
+ECOMAP_HEADER = struct.Struct('<4sHHIIII')
+# 파일의 uint32 구역에 맞는 배열 형식 (플랫폼마다 'I'/'L'의 크기가 다를 수 있음)
+ECOMAP_UINT32 = next(t for t in 'IL' if array(t).itemsize == 4)
+
+def _le_bytes(arr):
+    # 배열을 little-endian 바이트로 (대부분의 PC는 그대로)
+    if sys.byteorder == 'big':
+        arr = array(arr.typecode, arr)
+        arr.byteswap()
+    return arr.tobytes()
+
+def _le_array(typecode, view):
+    arr = array(typecode)
+    arr.frombytes(view)
+    if sys.byteorder == 'big':
+        arr.byteswap()
+    return arr
+
+def write_ecomap_file(file_path, snapshot):
+    # 스냅샷에 쓰인 이름만 모아 파일 전용 문자열 표를 만듦
+    local = {}
+    def local_id(idx):
+        lid = local.get(idx)
+        if lid is None:
+            lid = local[idx] = len(local)
+        return lid
+    client_id = local_id(snapshot.client_name)
+    names = array(ECOMAP_UINT32, map(local_id, snapshot.names))
+
+    encoded = [NAME_TABLE[idx].encode('utf-8') for idx in local]
+    offsets = array(ECOMAP_UINT32, [0])
+    for data in encoded:
+        offsets.append(offsets[-1] + len(data))
+
+    def write(f):
+        f.write(ECOMAP_HEADER.pack(ECOMAP_MAGIC, ECOMAP_VERSION, 0, len(names),
+                                   len(encoded), offsets[-1], client_id))
+        f.write(_le_bytes(snapshot.coords))
+        f.write(_le_bytes(names))
+        f.write(snapshot.relationships)
+        f.write(snapshot.directions)
+        f.write(_le_bytes(offsets))
+        f.write(b''.join(encoded))
+
+    # 실패해도 기존 파일은 그대로 남도록 임시 파일에 쓴 뒤 바꿔치기
+    write_file_replacing(file_path, write)
+
+def read_ecomap_file(file_path):
+    # 반환: MapSnapshot / 형식이 맞지 않으면 ValueError
+    with open(file_path, 'rb') as f:
+        data = f.read()
+    view = memoryview(data)
+    if len(data) < ECOMAP_HEADER.size:
+        raise ValueError("올바른 .ecomap 파일이 아닙니다.")
+    magic, version, _, count, str_count, str_bytes, client_id = ECOMAP_HEADER.unpack_from(view)
+    if magic != ECOMAP_MAGIC:
+        raise ValueError("올바른 .ecomap 파일이 아닙니다.")
+    if version > ECOMAP_VERSION:
+        raise ValueError(f"지원하지 않는 파일 버전입니다: {version}")
+
+    sizes = (16 * (count + 1), 4 * count, count, count, 4 * (str_count + 1), str_bytes)
+    if len(data) != ECOMAP_HEADER.size + sum(sizes):
+        raise ValueError("파일이 손상되었습니다.")
+    sections = []
+    pos = ECOMAP_HEADER.size
+    for size in sizes:
+        sections.append(view[pos:pos + size])
+        pos += size
+    coords_v, names_v, rels_v, dirs_v, offsets_v, strings_v = sections
+
+    relationships = bytes(rels_v)
+    directions = bytes(dirs_v)
+    local_names = _le_array(ECOMAP_UINT32, names_v)
+    offsets = _le_array(ECOMAP_UINT32, offsets_v)
+    if count and (max(relationships) >= len(RELATIONSHIPS) or max(directions) >= len(DIRECTIONS) or
+                  max(local_names) >= str_count):
+        raise ValueError("파일이 손상되었습니다.")
+    if client_id >= str_count or offsets[0] != 0 or offsets[-1] != str_bytes:
+        raise ValueError("파일이 손상되었습니다.")
+    # 시작 위치는 줄어들지 않아야 함 (처음이 0, 마지막이 str_bytes이므로 모두 범위 안)
+    if any(offsets[i] > offsets[i + 1] for i in range(str_count)):
+        raise ValueError("파일이 손상되었습니다.")
+
+    # 파일의 문자열 표 번호를 공유 문자열 표 번호로 바꿈 (서로 다른 이름 수만큼만 디코딩)
+    ids = [NAME_TABLE.intern(str(strings_v[offsets[i]:offsets[i + 1]], 'utf-8'))
+           for i in range(str_count)]
+    names = array('I', map(ids.__getitem__, local_names))
+    return MapSnapshot(ids[client_id], _le_array('d', coords_v), names, relationships, directions)
+
+# --- 여러 명 한꺼번에 입력 파싱 ---
+# 관계/방향은 영문 코드나 한글 표기 모두 허용
+REL_ALIASES = {'좋은': 'good', '소원': 'distant', '갈등': 'conflict'}
+DIR_ALIASES = {'양방향': 'both', '나감': 'from', '들어옴': 'to'}
+
+def parse_people_lines(text, default_rel, default_dir):
+    people, errors = [], []
+    for line_no, line in enumerate(text.splitlines(), 1):
+        fields = [f.strip() for f in line.replace('\t', ',').split(',')]
+        if not fields[0]:
+            continue # 빈 줄 무시
+        name = fields[0]
+        rel = fields[1] if len(fields) > 1 and fields[1] else default_rel
+        direction = fields[2] if len(fields) > 2 and fields[2] else default_dir
+        rel = REL_ALIASES.get(rel, rel)
+        direction = DIR_ALIASES.get(direction, direction)
+        if rel not in REL_CODES or direction not in DIR_CODES or len(fields) > 3:
+            errors.append(f"{line_no}번째 줄: {line.strip()}")
+            continue
+        people.append((name, rel, direction))
+    return people, errors
+
+# --- 타일(띠) 방식 PNG 저장 ---
+# 전체 이미지를 한 번에 만들지 않고 가로 띠 단위로 그려 바로 PNG로 압축합니다.
+# 메모리 사용량은 출력 크기와 관계없이 띠 하나 크기(EXPORT_STRIP_BYTES)로 제한됩니다.
+def _png_chunk(f, tag, data):
+    f.write(struct.pack('>I', len(data)))
+    f.write(tag)
+    f.write(data)
+    f.write(struct.pack('>I', zlib.crc32(data, zlib.crc32(tag)) & 0xffffffff))
+
+class ExportCancelled(Exception):
+    pass
+
+def write_file_replacing(file_path, write):
+    # 같은 폴더의 임시 파일에 모두 쓴 뒤 원래 파일과 바꿔치기
+    # write(f)가 실패하거나 취소되면 임시 파일만 지우고 기존 파일은 그대로 둠
+    if os.path.exists(file_path) and not os.access(file_path, os.W_OK):
+        raise PermissionError(f"파일에 쓸 수 없습니다: {file_path}")
+    tmp_path = f"{file_path}.{os.urandom(4).hex()}.tmp"
+    f = open(tmp_path, 'xb')
+    try:
+        with f:
+            write(f)
+        if os.path.exists(file_path):
+            shutil.copymode(file_path, tmp_path) # 기존 파일의 권한 유지
+        os.replace(tmp_path, file_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def write_tiled_png(file_path, width, height, render_strip, dpi=None, progress=None,
+                    background=None):
+    # render_strip(painter, top, strip_height): 띠 영역(이미지 좌표 top부터)을 그림
+    # progress(done_rows, height): 띠마다 호출, ExportCancelled를 발생시키면 중단
+    # background: 띠마다 먼저 칠할 배경색 (기본: 흰색)
+    # 중단되거나 실패하면 기존 파일은 그대로 남음
+    if background is None:
+        background = QColor("white")
+    write_file_replacing(file_path, lambda f: _write_tiled_png(f, width, height, render_strip,
+                                                               dpi, progress, background))
+
+def _write_tiled_png(f, width, height, render_strip, dpi, progress, background):
+    row_bytes = width * 3
+    strip_height = max(1, min(height, CONSTANTS['EXPORT_STRIP_BYTES'] // max(1, row_bytes)))
+    image = QImage(width, strip_height, QImage.Format.Format_RGB888)
+
+    f.write(b'\x89PNG\r\n\x1a\n')
+    # 8비트 RGB, 필터/인터레이스 없음
+    _png_chunk(f, b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0))
+    if dpi:
+        ppm = int(round(dpi / 0.0254)) # 인쇄용 해상도 정보 (미터당 픽셀)
+        _png_chunk(f, b'pHYs', struct.pack('>IIB', ppm, ppm, 1))
+
+    compressor = zlib.compressobj(6)
+    pending = bytearray()
+    for top in range(0, height, strip_height):
+        rows = min(strip_height, height - top)
+        image.fill(background)
+        painter = QPainter(image)
+        painter.setRenderHint(QPainter.RenderHint.Antialiasing)
+        render_strip(painter, top, rows)
+        painter.end()
+
+        # 각 행 앞에 필터 바이트(0)를 붙여 압축기로 전달
+        bits = image.constBits()
+        bits.setsize(image.sizeInBytes())
+        data = memoryview(bits)
+        stride = image.bytesPerLine()
+        for y in range(rows):
+            pending += compressor.compress(b'\x00')
+            pending += compressor.compress(data[y * stride:y * stride + row_bytes])
+        if len(pending) >= 65536:
+            _png_chunk(f, b'IDAT', bytes(pending))
+            pending.clear()
+        if progress:
+            progress(top + rows, height)
+
+    pending += compressor.flush()
+    _png_chunk(f, b'IDAT', bytes(pending))
+    _png_chunk(f, b'IEND', b'')
+
+# --- 스냅샷 렌더러 (scene 없이 QPainter로 직접 그림, 작업 스레드에서 사용) ---
+class SnapshotRenderer:
+    def __init__(self, snapshot, palette):
+        # palette: StyleCache.palette() (GUI 스레드에서 미리 만든 스타일 묶음)
+        r = CONSTANTS['NODE_RADIUS']
+        self.palette = palette
+
+        # 도형은 한 번만 계산하고, 띠마다 영역이 겹치는 것만 그림
+        c_name, c_x, c_y = snapshot.client
+        client_pos = QPointF(c_x, c_y)
+        self.links = []
+        self.nodes = [(QRectF(c_x - r, c_y - r, r*2, r*2), c_name, 'Client')]
+        for name, x, y, rel, direction in snapshot.iter_people():
+            path, start_arrow, end_arrow = link_geometry(client_pos, QPointF(x, y), rel, direction)
+            arrows = [a for a in (start_arrow, end_arrow) if a is not None]
+            bounds = path.boundingRect().adjusted(-10, -10, 10, 10)
+            self.links.append((bounds, path, arrows, rel))
+            self.nodes.append((QRectF(x - r, y - r, r*2, r*2), name, 'Person'))
+
+        # 스냅샷에 들어 있는 것(보이는 인물)만 감싸는 영역 (원, 라벨, 링크)
+        metrics = QFontMetricsF(palette['font'])
+        self.bounds = QRectF()
+        for rect, name, _ in self.nodes:
+            label_rect = rect.adjusted(-rect.width(), 0, rect.width(), 0)
+            text_rect = metrics.boundingRect(label_rect, Qt.AlignmentFlag.AlignCenter, name)
+            self.bounds = self.bounds.united(rect).united(text_rect)
+        for bounds, *_ in self.links:
+            self.bounds = self.bounds.united(bounds)
+
+    def render(self, painter, area):
+        # area: 그릴 영역 (scene 좌표)
+        palette = self.palette
+        for bounds, path, arrows, rel in self.links:
+            if not bounds.intersects(area):
+                continue
+            painter.setPen(palette['link_pens'][rel])
+            painter.setBrush(Qt.BrushStyle.NoBrush)
+            painter.drawPath(path)
+            if arrows:
+                painter.setPen(Qt.PenStyle.NoPen)
+                painter.setBrush(palette['arrow_brushes'][rel])
+                for arrow in arrows:
+                    painter.drawPolygon(arrow)
+
+        painter.setFont(palette['font'])
+        for rect, name, node_type in self.nodes:
+            # 라벨이 원보다 넓을 수 있으므로 좌우로 넉넉히 검사
+            label_rect = rect.adjusted(-rect.width(), 0, rect.width(), 0)
+            if not label_rect.intersects(area):
+                continue
+            painter.setPen(palette['node_pens'][node_type])
+            painter.setBrush(palette['node_brush'])
+            painter.drawEllipse(rect)
+            painter.setPen(palette['text_pen'])
+            painter.drawText(label_rect, Qt.AlignmentFlag.AlignCenter, name)
+
+# --- 이미지 저장 작업 (작업 스레드에서 실행) ---
+class ExportWorker(QObject):
+    progress = pyqtSignal(int)          # 진행률 (%)
+    finished = pyqtSignal(bool, str)    # 성공 여부, 오류 메시지 (취소 시 빈 문자열)
+
+    MARGIN = 50 # 그림 둘레 여백 (scene 좌표)
+
+    def __init__(self, file_path, snapshot, dpi, palette):
+        super().__init__()
+        self.file_path = file_path
+        self.snapshot = snapshot
+        self.palette = palette
+        self.dpi = dpi
+        self.cancelled = False # GUI 스레드에서 직접 설정
+
+    def cancel(self):
+        self.cancelled = True
+
+    def report_progress(self, done, total):
+        if self.cancelled:
+            raise ExportCancelled()
+        self.progress.emit(int(done * 100 / total))
+
+    def run(self):
+        scale = self.dpi / CONSTANTS['SCREEN_DPI']
+        try:
+            renderer = SnapshotRenderer(self.snapshot, self.palette)
+            # 숨긴 레이어는 스냅샷에 없으므로 보이는 항목만으로 크기를 정함
+            m = self.MARGIN
+            rect = renderer.bounds.adjusted(-m, -m, m, m)
+            width = max(1, math.ceil(rect.width() * scale))
+            height = max(1, math.ceil(rect.height() * scale))
+
+            def render_strip(painter, top, rows):
+                # 띠 영역만 scene 좌표로 변환하여 그림
+                painter.translate(0, -top)
+                painter.scale(scale, scale)
+                painter.translate(-rect.left(), -rect.top())
+                renderer.render(painter, QRectF(rect.left(), rect.top() + top / scale,
+                                                rect.width(), rows / scale))
+
+            write_tiled_png(self.file_path, width, height, render_strip, self.dpi,
+                            self.report_progress, self.palette['canvas'])
+        except ExportCancelled:
+            self.finished.emit(False, "")
+        except OSError as e:
+            self.finished.emit(False, str(e))
+        except Exception as e:
+            # 작업 스레드의 예외가 슬롯 밖으로 나가면 프로그램이 종료되므로 모두 결과로 알림
+            self.finished.emit(False, str(e) or type(e).__name__)
+        else:
+            self.finished.emit(True, "")
+
 # --- 데이터베이스 관리 클래스 (SQLite) ---
 class EcomapDB:
     def __init__(self, db_name="ecomap_local.db"):
@@ -57,35 +555,154 @@ class EcomapDB:
                 FOREIGN KEY(map_id) REFERENCES maps(id) ON DELETE CASCADE
             )
         ''')
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_nodes_map ON nodes(map_id)")
+        # 통계용 요약 테이블 (생태도별 이름·관계·방향 집계, save_map/delete_map에서 갱신)
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'relation_summary'")
+        summary_exists = cursor.fetchone() is not None
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS relation_summary (
+                map_id INTEGER,
+                name TEXT,
+                relationship TEXT,
+                direction TEXT,
+                month TEXT,  -- 생태도를 마지막으로 저장한 월 (월별 추이는 relation_history 사용)
+                cnt INTEGER,
+                PRIMARY KEY(map_id, name, relationship, direction)
+            )
+        ''')
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_summary_rel ON relation_summary(relationship, direction, map_id, cnt)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_summary_name ON relation_summary(name, relationship, map_id, cnt)")
+        cursor.execute("DROP INDEX IF EXISTS idx_summary_month") # 월별 조회는 relation_history로 옮김
+        if not summary_exists:
+            self.rebuild_summary(cursor)
+
+        # 월별 추이용 요약 (저장한 달마다 그 달의 마지막 저장 내용을 남김, 지난 달 행은 바꾸지 않음)
+        # 저장할 때마다 maps.id가 새로 생기므로 생태도 이름으로 구분
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'relation_history'")
+        history_exists = cursor.fetchone() is not None
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS relation_history (
+                map_name TEXT,
+                month TEXT,  -- 저장 월 (YYYY-MM)
+                name TEXT,
+                relationship TEXT,
+                direction TEXT,
+                cnt INTEGER,
+                PRIMARY KEY(map_name, month, name, relationship, direction)
+            )
+        ''')
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_history_month ON relation_history(month, relationship, map_name, cnt)")
+        if not history_exists:
+            # 기존 DB는 마지막 저장 월의 요약으로 시작
+            cursor.execute('''
+                INSERT INTO relation_history (map_name, month, name, relationship, direction, cnt)
+                SELECT m.name, s.month, s.name, s.relationship, s.direction, s.cnt
+                FROM relation_summary s JOIN maps m ON m.id = s.map_id
+            ''')
         self.conn.commit()
 
+    def _record_history(self, cursor, map_name, map_id, month):
+        # 이번 달 행만 현재 요약으로 교체 (이번 달 안에서 여러 번 저장하면 마지막 내용이 남음)
+        cursor.execute("DELETE FROM relation_history WHERE map_name = ? AND month = ?", (map_name, month))
+        cursor.execute('''
+            INSERT INTO relation_history (map_name, month, name, relationship, direction, cnt)
+            SELECT ?, ?, name, relationship, direction, cnt FROM relation_summary WHERE map_id = ?
+        ''', (map_name, month, map_id))
+
+    def rebuild_summary(self, cursor):
+        # 요약 테이블이 없던 기존 DB는 nodes 테이블에서 한 번에 채움
+        cursor.execute("DELETE FROM relation_summary")
+        cursor.execute('''
+            INSERT INTO relation_summary (map_id, name, relationship, direction, month, cnt)
+            SELECT n.map_id, n.name, n.relationship, n.direction, substr(m.updated_at, 1, 7), COUNT(*)
+            FROM nodes n JOIN maps m ON m.id = n.map_id
+            WHERE n.type = 'Person'
+            GROUP BY n.map_id, n.name, n.relationship, n.direction
+        ''')
+
+    def _delete_map_rows(self, cursor, map_name):
+        # 맵과 딸린 노드/요약 행을 함께 삭제
+        cursor.execute("SELECT id FROM maps WHERE name = ?", (map_name,))
+        row = cursor.fetchone()
+        if not row:
+            return
+        cursor.execute("DELETE FROM relation_summary WHERE map_id = ?", (row[0],))
+        cursor.execute("DELETE FROM nodes WHERE map_id = ?", (row[0],))
+        cursor.execute("DELETE FROM maps WHERE id = ?", (row[0],))
+
     def save_map(self, map_name, client_data, people_data):
+        people_rows = ((p['name'], p['relationship'], p['direction'], p['x'], p['y'])
+                       for p in people_data)
+        return self._write_map(map_name, (client_data['name'], client_data['x'], client_data['y']),
+                               people_rows)
+
+    def save_snapshot(self, map_name, snapshot):
+        people_rows = ((name, rel, d, x, y) for name, x, y, rel, d in snapshot.iter_people())
+        return self._write_map(map_name, snapshot.client, people_rows)
+
+    def _write_map(self, map_name, client_row, people_rows):
         cursor = self.conn.cursor()
         try:
             # 기존 동일 이름 맵 삭제 (덮어쓰기 로직)
-            cursor.execute("DELETE FROM maps WHERE name = ?", (map_name,))
+            self._delete_map_rows(cursor, map_name)
             
             # 맵 생성
+            updated_at = datetime.now().isoformat()
             cursor.execute("INSERT INTO maps (name, updated_at) VALUES (?, ?)", 
-                           (map_name, datetime.now().isoformat()))
+                           (map_name, updated_at))
             map_id = cursor.lastrowid
+            people_rows = list(people_rows)
 
             # Client 저장
             cursor.execute('''
                 INSERT INTO nodes (map_id, type, name, x, y) 
                 VALUES (?, 'Client', ?, ?, ?)
-            ''', (map_id, client_data['name'], client_data['x'], client_data['y']))
+            ''', (map_id, *client_row))
 
             # People 저장
-            for p in people_data:
-                cursor.execute('''
-                    INSERT INTO nodes (map_id, type, name, relationship, direction, x, y) 
-                    VALUES (?, 'Person', ?, ?, ?, ?, ?)
-                ''', (map_id, p['name'], p['relationship'], p['direction'], p['x'], p['y']))
+            cursor.executemany('''
+                INSERT INTO nodes (map_id, type, name, relationship, direction, x, y) 
+                VALUES (?, 'Person', ?, ?, ?, ?, ?)
+            ''', ((map_id, *row) for row in people_rows))
+
+            # 통계 요약 갱신 (이 맵의 행만)
+            counts = Counter(row[:3] for row in people_rows)
+            cursor.executemany('''
+                INSERT INTO relation_summary (map_id, name, relationship, direction, month, cnt)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', ((map_id, name, rel, d, updated_at[:7], cnt) for (name, rel, d), cnt in counts.items()))
+            self._record_history(cursor, map_name, map_id, updated_at[:7])
             
             self.conn.commit()
             return True, "저장되었습니다."
         except Exception as e:
+            self.conn.rollback()
+            return False, str(e)
+
+    def update_positions(self, map_name, moved):
+        # 좌표만 바뀐 경우 해당 노드 행만 갱신
+        # moved: MapSnapshot.moved_since() 결과 (번호는 저장할 때의 노드 순서)
+        cursor = self.conn.cursor()
+        try:
+            cursor.execute("SELECT id FROM maps WHERE name = ?", (map_name,))
+            row = cursor.fetchone()
+            if not row:
+                return False, "저장된 생태도를 찾을 수 없습니다."
+            map_id = row[0]
+            cursor.execute("SELECT id FROM nodes WHERE map_id = ? ORDER BY type = 'Person', id", (map_id,))
+            node_ids = [r[0] for r in cursor.fetchall()]
+            cursor.executemany("UPDATE nodes SET x = ?, y = ? WHERE id = ?",
+                               ((x, y, node_ids[i]) for i, x, y in moved))
+
+            updated_at = datetime.now().isoformat()
+            cursor.execute("UPDATE maps SET updated_at = ? WHERE id = ?", (updated_at, map_id))
+            cursor.execute("UPDATE relation_summary SET month = ? WHERE map_id = ?",
+                           (updated_at[:7], map_id))
+            self._record_history(cursor, map_name, map_id, updated_at[:7])
+            self.conn.commit()
+            return True, "저장되었습니다."
+        except Exception as e:
+            self.conn.rollback()
             return False, str(e)
 
     def get_map_list(self):
@@ -115,11 +732,262 @@ class EcomapDB:
                 result['people'].append(node_data)
         return result
 
+    def open_map(self, map_name):
+        # 큰 생태도를 나눠 불러오기 위한 커서 기반 조회
+        # 반환: (Client (이름, x, y), 주변 인물 수, (이름, x, y, 관계, 방향) 반복자) / 맵이 없으면 None
+        cursor = self.conn.cursor()
+        cursor.execute("SELECT id FROM maps WHERE name = ?", (map_name,))
+        row = cursor.fetchone()
+        if not row:
+            return None
+        map_id = row[0]
+
+        cursor.execute("SELECT name, x, y FROM nodes WHERE map_id = ? AND type = 'Client' LIMIT 1", (map_id,))
+        client = cursor.fetchone()
+        if client is None:
+            raise ValueError("생태도에 중심 인물 데이터가 없습니다.")
+        cursor.execute("SELECT COUNT(*) FROM nodes WHERE map_id = ? AND type = 'Person'", (map_id,))
+        total = cursor.fetchone()[0]
+
+        def iter_people():
+            people_cursor = self.conn.cursor()
+            people_cursor.execute('''
+                SELECT name, x, y, relationship, direction FROM nodes
+                WHERE map_id = ? AND type = 'Person' ORDER BY id
+            ''', (map_id,))
+            while True:
+                rows = people_cursor.fetchmany(CONSTANTS['LOAD_FETCH_ROWS'])
+                if not rows:
+                    break
+                yield from rows
+
+        return client, total, iter_people()
+
     def delete_map(self, map_name):
         cursor = self.conn.cursor()
-        cursor.execute("DELETE FROM maps WHERE name = ?", (map_name,))
+        self._delete_map_rows(cursor, map_name)
+        cursor.execute("DELETE FROM relation_history WHERE map_name = ?", (map_name,))
         self.conn.commit()
 
+    # --- 통계 (요약 테이블만 조회) ---
+    # 그룹 -> (조회 테이블, 생태도 구분 열, 그룹 키)
+    STAT_GROUPS = {
+        'relationship': ('relation_summary', 'map_id', ('relationship', 'direction')),
+        'name': ('relation_summary', 'map_id', ('name', 'relationship')),
+        'month': ('relation_history', 'map_name', ('month', 'relationship')),
+    }
+
+    def relation_stats(self, group_by='relationship', name_filter='', relationship=None, direction=None):
+        # 반환: (헤더, 행 목록) - 각 행은 그룹 키 + 생태도 수 + 관계 수
+        table, map_key, keys = self.STAT_GROUPS[group_by]
+        where, params = [], []
+        if name_filter:
+            where.append("name LIKE ?")
+            params.append(f"%{name_filter}%")
+        if relationship:
+            where.append("relationship = ?")
+            params.append(relationship)
+        if direction:
+            where.append("direction = ?")
+            params.append(direction)
+
+        key_sql = ", ".join(keys)
+        sql = f"SELECT {key_sql}, COUNT(DISTINCT {map_key}), SUM(cnt) FROM {table}"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += f" GROUP BY {key_sql} ORDER BY {key_sql}"
+
+        cursor = self.conn.cursor()
+        cursor.execute(sql, params)
+        return list(keys) + ['map_count', 'relation_count'], cursor.fetchall()
+
+# --- 스타일 캐시 (펜/브러시/폰트를 테마별로 한 번만 만들고 모든 아이템이 공유) ---
+# 키: (종류, 노드 종류/관계, 선택 여부, 테마). Qt 스타일 객체는 암시적 공유이므로
+# 같은 객체를 여러 아이템에 넘겨도 복사 비용이 없습니다. 받은 객체는 수정하지 마세요.
+class StyleCache:
+    def __init__(self, theme='default'):
+        self.theme = theme
+        self.cache = {}
+
+    def set_theme(self, theme):
+        if theme not in THEMES:
+            raise ValueError(f"알 수 없는 테마: {theme}")
+        self.theme = theme
+
+    def get(self, key, factory):
+        key = key + (self.theme,)
+        obj = self.cache.get(key)
+        if obj is None:
+            obj = self.cache[key] = factory(THEMES[self.theme])
+        return obj
+
+    def node_pen(self, node_type, selected=False):
+        def make(t):
+            if selected:
+                pen = QPen(QColor(t['selected']))
+                pen.setWidth(t['line_width'] + 2)
+                pen.setStyle(Qt.PenStyle.DashLine)
+            elif node_type == 'Client':
+                pen = QPen(QColor(t['client']))
+                pen.setWidth(t['line_width'] + 1)
+            else:
+                pen = QPen(QColor(t['person']))
+                pen.setWidth(t['line_width'])
+            return pen
+        return self.get(('node_pen', node_type, selected), make)
+
+    def node_brush(self):
+        return self.get(('node_brush', None, False), lambda t: QBrush(QColor(t['node_fill'])))
+
+    def text_color(self):
+        return self.get(('text_color', None, False), lambda t: QColor(t['text']))
+
+    def text_pen(self):
+        return self.get(('text_pen', None, False), lambda t: QPen(QColor(t['text'])))
+
+    def font(self):
+        def make(t):
+            font = QFont(CONSTANTS['FONT_FAMILY'], 10)
+            font.setBold(True)
+            return font
+        return self.get(('font', None, False), make)
+
+    def canvas_brush(self):
+        return self.get(('canvas', None, False), lambda t: QBrush(QColor(t['canvas'])))
+
+    def link_pen(self, relationship):
+        def make(t):
+            pen = QPen(QColor(t.get(relationship, t['text'])))
+            pen.setWidth(t['line_width'])
+            if relationship == 'distant':
+                pen.setStyle(Qt.PenStyle.DashLine)
+            return pen
+        return self.get(('link_pen', relationship, False), make)
+
+    def arrow_pen(self, relationship):
+        def make(t):
+            pen = QPen(QColor(t.get(relationship, t['text'])))
+            pen.setWidth(1)
+            return pen
+        return self.get(('arrow_pen', relationship, False), make)
+
+    def arrow_brush(self, relationship):
+        return self.get(('arrow_brush', relationship, False),
+                        lambda t: QBrush(QColor(t.get(relationship, t['text']))))
+
+    def palette(self):
+        # 작업 스레드(이미지 저장)에 넘길 현재 테마의 스타일 묶음 (GUI 스레드에서 호출)
+        return {
+            'font': self.font(),
+            'text_pen': self.text_pen(),
+            'node_brush': self.node_brush(),
+            'canvas': QColor(THEMES[self.theme]['canvas']),
+            'node_pens': {t: self.node_pen(t) for t in ('Person', 'Client')},
+            'link_pens': {rel: self.link_pen(rel) for rel in RELATIONSHIPS},
+            'arrow_brushes': {rel: self.arrow_brush(rel) for rel in RELATIONSHIPS},
+        }
+
+STYLES = StyleCache()
+
+# --- 링크 도형 계산 (화면 아이템과 이미지 저장에서 공용) ---
+def link_geometry(src_pos, tgt_pos, relationship, direction):
+    # 반환: (선 경로, 시작 화살표, 끝 화살표) - 화살표는 QPolygonF 또는 None
+    path = QPainterPath()
+    
+    # 노드 반지름만큼 띄우기
+    offset = CONSTANTS['NODE_RADIUS'] + 5
+    
+    line = QLineF(src_pos, tgt_pos)
+    length = line.length()
+    
+    if length <= offset * 2:
+        # 너무 가까우면 그리지 않음
+        return path, None, None
+
+    # 시작점과 끝점 조정 (원 테두리)
+    vec = (tgt_pos - src_pos) / length if length > 0 else QPointF(0,0)
+    start_p = src_pos + vec * offset
+    end_p = tgt_pos - vec * offset
+    
+    # 경로 그리기
+    if relationship == 'conflict':
+        # 지그재그 생성 (양 끝에 직선 구간 추가)
+        straight_len = 20 # 직선 구간 길이
+        
+        dist = QLineF(start_p, end_p).length()
+        
+        if dist > straight_len * 2:
+            # 직선 구간을 제외한 지그재그 구간 계산
+            zigzag_start = start_p + vec * straight_len
+            zigzag_end = end_p - vec * straight_len
+            
+            path.moveTo(start_p)
+            path.lineTo(zigzag_start) # 시작 직선
+            
+            # 지그재그 그리기
+            zz_len = dist - (straight_len * 2)
+            segments = max(4, int(zz_len / 15)) # 세그먼트 길이 조정
+            amplitude = 6
+            
+            dx = (zigzag_end.x() - zigzag_start.x()) / segments
+            dy = (zigzag_end.y() - zigzag_start.y()) / segments
+            
+            # 수직 벡터 계산
+            perp_dx, perp_dy = -dy, dx
+            norm_perp = math.sqrt(perp_dx**2 + perp_dy**2)
+            if norm_perp == 0: norm_perp = 1
+            
+            for i in range(1, segments + 1):
+                mid_x = zigzag_start.x() + dx * (i - 0.5)
+                mid_y = zigzag_start.y() + dy * (i - 0.5)
+                
+                sign = 1 if i % 2 == 0 else -1
+                peak_x = mid_x + (amplitude * perp_dx / norm_perp) * sign
+                peak_y = mid_y + (amplitude * perp_dy / norm_perp) * sign
+                
+                path.lineTo(peak_x, peak_y)
+                path.lineTo(zigzag_start.x() + dx * i, zigzag_start.y() + dy * i)
+                
+            path.lineTo(end_p) # 끝 직선
+        else:
+            # 거리가 너무 짧으면 그냥 직선
+            path.moveTo(start_p)
+            path.lineTo(end_p)
+    else:
+        # 직선
+        path.moveTo(start_p)
+        path.lineTo(end_p)
+
+    # 화살표 그리기
+    return (path, *arrowhead_polygons(start_p, end_p, vec, direction))
+
+def arrowhead_polygons(start_p, end_p, vec, direction):
+    # 화살표 크기 및 각도
+    arrow_size = 10
+    angle = math.atan2(vec.y(), vec.x())
+    
+    # Start Arrow (To Client) - 역방향
+    start_arrow = None
+    if direction in ['to', 'both']:
+        p1 = start_p + QPointF(math.cos(angle + math.pi/6) * arrow_size, 
+                               math.sin(angle + math.pi/6) * arrow_size)
+        p2 = start_p + QPointF(math.cos(angle - math.pi/6) * arrow_size, 
+                               math.sin(angle - math.pi/6) * arrow_size)
+        start_arrow = QPolygonF([start_p, p1, p2])
+
+    # End Arrow (From Client) - 정방향
+    end_arrow = None
+    if direction in ['from', 'both']:
+        # 끝점에서는 벡터 반대 방향으로 화살표가 그려져야 함
+        rev_angle = angle + math.pi 
+        p1 = end_p + QPointF(math.cos(rev_angle + math.pi/6) * arrow_size, 
+                             math.sin(rev_angle + math.pi/6) * arrow_size)
+        p2 = end_p + QPointF(math.cos(rev_angle - math.pi/6) * arrow_size, 
+                             math.sin(rev_angle - math.pi/6) * arrow_size)
+        end_arrow = QPolygonF([end_p, p1, p2])
+
+    return start_arrow, end_arrow
+
 # --- 그래픽 아이템: 노드 (원) ---
 class NodeItem(QGraphicsEllipseItem):
     def __init__(self, x, y, name, node_type, parent_scene, app_ref=None):
@@ -135,61 +1003,122 @@ class NodeItem(QGraphicsEllipseItem):
         self.setPos(x, y)
         
         # 스타일 설정
-        self.setBrush(QBrush(QColor("white")))
-        self.default_pen = QPen(QColor(CONSTANTS['TEXT_COLOR']))
-        self.default_pen.setWidth(2)
-        
-        if node_type == 'Client':
-            self.default_pen.setColor(QColor(CONSTANTS['PRIMARY_COLOR']))
-            self.default_pen.setWidth(3)
-            
-        self.setPen(self.default_pen)
+        self.init_style()
         
         # 플래그 설정 (드래그 가능, 위치 변경 감지)
+        # ItemSendsGeometryChanges가 있어야 위치 변경 알림(ItemPositionHasChanged)을 받음
         self.setFlags(QGraphicsItem.GraphicsItemFlag.ItemIsMovable | 
-                      QGraphicsItem.GraphicsItemFlag.ItemSendsScenePositionChanges |
+                      QGraphicsItem.GraphicsItemFlag.ItemSendsGeometryChanges |
                       QGraphicsItem.GraphicsItemFlag.ItemIsSelectable)
         
         # 텍스트 라벨 추가
-        self.text_item = QGraphicsTextItem(name, self)
-        font = QFont(CONSTANTS['FONT_FAMILY'], 10)
-        font.setBold(True)
-        self.text_item.setFont(font)
+        self.init_label()
+
+        self.links = {} # 연결된 링크들 (순서 있는 집합으로 사용, 값은 None)
+
+    def init_style(self):
+        # 펜/브러시는 스타일 캐시에서 공유 객체를 받아 씀
+        self.setBrush(STYLES.node_brush())
+        self.default_pen = STYLES.node_pen(self.node_type)
+        self.setPen(self.selection_pen() if self.isSelected() else self.default_pen)
+
+    def selection_pen(self):
+        return STYLES.node_pen(self.node_type, selected=True)
+
+    def refresh_style(self):
+        # 테마 변경 시 호출
+        self.init_style()
+        self.text_item.setDefaultTextColor(STYLES.text_color())
+
+    def init_label(self):
+        self.text_item = QGraphicsTextItem(self.name, self)
+        self.text_item.setFont(STYLES.font())
+        self.text_item.setDefaultTextColor(STYLES.text_color())
         
         # 텍스트 중앙 정렬
         self.center_text()
 
-        self.links = [] # 연결된 링크들
+    def set_name(self, name):
+        self.name = name
+        self.text_item.setPlainText(name)
+        self.center_text()
 
     def center_text(self):
         text_rect = self.text_item.boundingRect()
         self.text_item.setPos(-text_rect.width()/2, -text_rect.height()/2)
 
     def itemChange(self, change, value):
-        if change == QGraphicsItem.GraphicsItemChange.ItemPositionChange:
-            # 노드가 움직일 때 연결된 링크들도 업데이트
+        if change == QGraphicsItem.GraphicsItemChange.ItemPositionHasChanged:
+            # 노드가 움직이면 연결된 링크들도 업데이트
             for link in self.links:
                 link.update_position()
+            if self.app_ref:
+                self.app_ref.note_change('moved', self)
         
         if change == QGraphicsItem.GraphicsItemChange.ItemSelectedChange:
             if value: # 선택됨
-                pen = QPen(QColor(CONSTANTS['DANGER_COLOR']))
-                pen.setWidth(4)
-                pen.setStyle(Qt.PenStyle.DashLine)
-                self.setPen(pen)
+                self.setPen(self.selection_pen())
             else: # 선택 해제됨
                 self.setPen(self.default_pen)
 
         return super().itemChange(change, value)
 
+    def mousePressEvent(self, event):
+        # 드래그 시작 (선택된 노드가 함께 움직이므로 하나의 편집으로 묶음)
+        if self.app_ref:
+            self.app_ref.begin_edit('move', self)
+        super().mousePressEvent(event)
+
     def mouseReleaseEvent(self, event):
-        # 드래그가 끝났을 때 상태 저장 (위치 변경 시)
+        # 드래그가 끝났을 때 상태 저장 (위치가 바뀌지 않았으면 기록하지 않음)
         super().mouseReleaseEvent(event)
         if self.app_ref:
-            self.app_ref.save_state_to_history()
+            self.app_ref.commit_edit()
 
     def add_link(self, link):
-        self.links.append(link)
+        self.links[link] = None
+
+    def remove_link(self, link):
+        self.links.pop(link, None)
+
+# --- 그래픽 아이템: 경량 노드 (대용량 생태도용) ---
+# 자식 QGraphicsTextItem 없이 paint()에서 라벨을 직접 그리고,
+# 펜/폰트는 모든 노드가 공유합니다.
+class CompactNodeItem(NodeItem):
+    def refresh_style(self):
+        self.init_style()
+        self.update()
+
+    def init_label(self):
+        self.static_text = QStaticText(self.name)
+        self.static_text.prepare(QTransform(), STYLES.font())
+        self.center_text()
+
+    def set_name(self, name):
+        # 라벨 너비가 boundingRect에 포함되므로 바뀌기 전에 알림
+        self.prepareGeometryChange()
+        self.name = name
+        self.init_label()
+        self.update()
+
+    def center_text(self):
+        size = self.static_text.size()
+        self.text_pos = QPointF(-size.width()/2, -size.height()/2)
+
+    def boundingRect(self):
+        # 라벨이 원보다 넓을 수 있으므로 라벨 영역까지 포함
+        rect = super().boundingRect()
+        size = self.static_text.size()
+        if size.width() > rect.width():
+            extra = (size.width() - rect.width()) / 2
+            rect = rect.adjusted(-extra, 0, extra, 0)
+        return rect
+
+    def paint(self, painter, option, widget=None):
+        super().paint(painter, option, widget)
+        painter.setFont(STYLES.font())
+        painter.setPen(STYLES.text_pen())
+        painter.drawStaticText(self.text_pos, self.static_text)
 
 # --- 그래픽 아이템: 링크 (선) ---
 class LinkItem(QGraphicsPathItem):
@@ -201,36 +1130,26 @@ class LinkItem(QGraphicsPathItem):
         self.direction = direction
         
         # 화살표 아이템 (자식 아이템으로 관리)
-        self.arrow_start = QGraphicsPathItem(self)
-        self.arrow_end = QGraphicsPathItem(self)
+        self.init_arrows()
         
         # Z-Index를 낮게 설정하여 노드 뒤로 가게 함
         self.setZValue(-1)
         self.update_style()
         self.update_position()
 
+    def init_arrows(self):
+        self.arrow_start = QGraphicsPathItem(self)
+        self.arrow_end = QGraphicsPathItem(self)
+
     def update_style(self):
-        pen = QPen()
-        pen.setWidth(2)
-        
-        color = QColor(CONSTANTS['TEXT_COLOR'])
-        if self.relationship == 'good':
-            color = QColor(CONSTANTS['SUCCESS_COLOR'])
-            pen.setStyle(Qt.PenStyle.SolidLine)
-        elif self.relationship == 'distant':
-            color = QColor(CONSTANTS['SECONDARY_COLOR'])
-            pen.setStyle(Qt.PenStyle.DashLine)
-        elif self.relationship == 'conflict':
-            color = QColor(CONSTANTS['DANGER_COLOR'])
-            pen.setStyle(Qt.PenStyle.SolidLine) 
-            
-        pen.setColor(color)
-        self.setPen(pen)
+        self.setPen(STYLES.link_pen(self.relationship))
         
         # 화살표 스타일
-        arrow_pen = QPen(color)
-        arrow_pen.setWidth(1)
-        arrow_brush = QBrush(color)
+        self.set_arrow_style(self.relationship)
+
+    def set_arrow_style(self, relationship):
+        arrow_pen = STYLES.arrow_pen(relationship)
+        arrow_brush = STYLES.arrow_brush(relationship)
         
         self.arrow_start.setPen(arrow_pen)
         self.arrow_start.setBrush(arrow_brush)
@@ -238,138 +1157,245 @@ class LinkItem(QGraphicsPathItem):
         self.arrow_end.setBrush(arrow_brush)
 
     def update_position(self):
-        src_pos = self.source.pos()
-        tgt_pos = self.target.pos()
-        
-        path = QPainterPath()
-        
-        # 노드 반지름만큼 띄우기
-        offset = CONSTANTS['NODE_RADIUS'] + 5
-        
-        line = QLineF(src_pos, tgt_pos)
-        length = line.length()
-        
-        if length <= offset * 2:
-            # 너무 가까우면 그리지 않음
-            self.setPath(path)
-            self.arrow_start.setPath(QPainterPath())
-            self.arrow_end.setPath(QPainterPath())
-            return
-
-        # 시작점과 끝점 조정 (원 테두리)
-        vec = (tgt_pos - src_pos) / length if length > 0 else QPointF(0,0)
-        start_p = src_pos + vec * offset
-        end_p = tgt_pos - vec * offset
-        
-        # 경로 그리기
-        if self.relationship == 'conflict':
-            # 지그재그 생성 (양 끝에 직선 구간 추가)
-            straight_len = 20 # 직선 구간 길이
-            
-            dist = QLineF(start_p, end_p).length()
-            
-            if dist > straight_len * 2:
-                # 직선 구간을 제외한 지그재그 구간 계산
-                zigzag_start = start_p + vec * straight_len
-                zigzag_end = end_p - vec * straight_len
-                
-                path.moveTo(start_p)
-                path.lineTo(zigzag_start) # 시작 직선
-                
-                # 지그재그 그리기
-                zz_len = dist - (straight_len * 2)
-                segments = max(4, int(zz_len / 15)) # 세그먼트 길이 조정
-                amplitude = 6
-                
-                dx = (zigzag_end.x() - zigzag_start.x()) / segments
-                dy = (zigzag_end.y() - zigzag_start.y()) / segments
-                
-                # 수직 벡터 계산
-                perp_dx, perp_dy = -dy, dx
-                norm_perp = math.sqrt(perp_dx**2 + perp_dy**2)
-                if norm_perp == 0: norm_perp = 1
-                
-                for i in range(1, segments + 1):
-                    mid_x = zigzag_start.x() + dx * (i - 0.5)
-                    mid_y = zigzag_start.y() + dy * (i - 0.5)
-                    
-                    sign = 1 if i % 2 == 0 else -1
-                    peak_x = mid_x + (amplitude * perp_dx / norm_perp) * sign
-                    peak_y = mid_y + (amplitude * perp_dy / norm_perp) * sign
-                    
-                    path.lineTo(peak_x, peak_y)
-                    path.lineTo(zigzag_start.x() + dx * i, zigzag_start.y() + dy * i)
-                    
-                path.lineTo(end_p) # 끝 직선
-            else:
-                # 거리가 너무 짧으면 그냥 직선
-                path.moveTo(start_p)
-                path.lineTo(end_p)
-        else:
-            # 직선
-            path.moveTo(start_p)
-            path.lineTo(end_p)
-
+        path, start_arrow, end_arrow = link_geometry(self.source.pos(), self.target.pos(),
+                                                     self.relationship, self.direction)
         self.setPath(path)
-        
-        # 화살표 그리기
-        self.update_arrowheads(start_p, end_p, vec)
+        self.set_arrows(start_arrow, end_arrow)
 
-    def update_arrowheads(self, start_p, end_p, vec):
-        # 화살표 크기 및 각도
-        arrow_size = 10
-        angle = math.atan2(vec.y(), vec.x())
-        
-        # Start Arrow (To Client) - 역방향
-        if self.direction in ['to', 'both']:
-            p1 = start_p + QPointF(math.cos(angle + math.pi/6) * arrow_size, 
-                                   math.sin(angle + math.pi/6) * arrow_size)
-            p2 = start_p + QPointF(math.cos(angle - math.pi/6) * arrow_size, 
-                                   math.sin(angle - math.pi/6) * arrow_size)
-            arrow_path = QPainterPath()
-            arrow_path.moveTo(start_p)
-            arrow_path.lineTo(p1)
-            arrow_path.lineTo(p2)
-            arrow_path.closeSubpath()
-            self.arrow_start.setPath(arrow_path)
-        else:
-            self.arrow_start.setPath(QPainterPath())
-
-        # End Arrow (From Client) - 정방향
-        if self.direction in ['from', 'both']:
-            # 끝점에서는 벡터 반대 방향으로 화살표가 그려져야 함
-            rev_angle = angle + math.pi 
-            p1 = end_p + QPointF(math.cos(rev_angle + math.pi/6) * arrow_size, 
-                                 math.sin(rev_angle + math.pi/6) * arrow_size)
-            p2 = end_p + QPointF(math.cos(rev_angle - math.pi/6) * arrow_size, 
-                                 math.sin(rev_angle - math.pi/6) * arrow_size)
+    def set_arrows(self, start_arrow, end_arrow):
+        for item, polygon in ((self.arrow_start, start_arrow), (self.arrow_end, end_arrow)):
             arrow_path = QPainterPath()
-            arrow_path.moveTo(end_p)
-            arrow_path.lineTo(p1)
-            arrow_path.lineTo(p2)
-            arrow_path.closeSubpath()
-            self.arrow_end.setPath(arrow_path)
-        else:
-            self.arrow_end.setPath(QPainterPath())
+            if polygon is not None:
+                arrow_path.addPolygon(polygon)
+                arrow_path.closeSubpath()
+            item.setPath(arrow_path)
+
+# --- 그래픽 아이템: 경량 링크 ---
+# 화살표를 자식 아이템 대신 자신의 paint()에서 직접 그립니다.
+class CompactLinkItem(LinkItem):
+    ARROW_MARGIN = 10 # 화살표 크기만큼 영역 확장
+
+    def init_arrows(self):
+        self.arrow_polygons = ()
+        self.arrow_brush = None # update_style()에서 설정
+
+    def set_arrow_style(self, relationship):
+        self.arrow_brush = STYLES.arrow_brush(relationship)
+        self.update()
+
+    def set_arrows(self, start_arrow, end_arrow):
+        self.prepareGeometryChange()
+        self.arrow_polygons = tuple(p for p in (start_arrow, end_arrow) if p is not None)
+
+    def boundingRect(self):
+        m = self.ARROW_MARGIN
+        return super().boundingRect().adjusted(-m, -m, m, m)
+
+    def paint(self, painter, option, widget=None):
+        super().paint(painter, option, widget)
+        if self.arrow_polygons:
+            painter.setPen(Qt.PenStyle.NoPen)
+            painter.setBrush(self.arrow_brush)
+            for polygon in self.arrow_polygons:
+                painter.drawPolygon(polygon)
+
+# --- 관계 레이어 (관계·방향별로 아이템을 묶어 한 번에 보이기/숨기기) ---
+# 그리지는 않고 자식 아이템의 부모 역할만 하므로, setVisible 한 번으로 묶음 전체가 바뀝니다.
+class LayerItem(QGraphicsItem):
+    def __init__(self, z):
+        super().__init__()
+        self.setFlag(QGraphicsItem.GraphicsItemFlag.ItemHasNoContents)
+        self.setZValue(z)
+
+    def boundingRect(self):
+        return QRectF()
+
+    def paint(self, painter, option, widget=None):
+        pass
+
+# --- 통계 창 (전체 생태도 대상 집계) ---
+class AnalyticsDialog(QDialog):
+    HEADER_LABELS = {
+        'relationship': '관계', 'direction': '방향', 'name': '이름', 'month': '월',
+        'map_count': '생태도 수', 'relation_count': '관계 수',
+    }
+
+    def __init__(self, db, parent=None):
+        super().__init__(parent)
+        self.db = db
+        self.header = []
+        self.rows = []
+        self.setWindowTitle("생태도 통계")
+        self.resize(640, 480)
+
+        layout = QVBoxLayout(self)
+
+        # 조회 조건
+        filter_layout = QHBoxLayout()
+        self.name_input = QLineEdit()
+        self.name_input.setPlaceholderText("이름 포함 (예: 학교)")
+        self.name_input.returnPressed.connect(self.run_query)
+
+        self.rel_combo = QComboBox()
+        self.rel_combo.addItem("전체 관계", None)
+        for rel in RELATIONSHIPS:
+            self.rel_combo.addItem(rel, rel)
+
+        self.dir_combo = QComboBox()
+        self.dir_combo.addItem("전체 방향", None)
+        for d in DIRECTIONS:
+            self.dir_combo.addItem(d, d)
+
+        self.group_combo = QComboBox()
+        self.group_combo.addItem("관계·방향별", 'relationship')
+        self.group_combo.addItem("이름(조직)별", 'name')
+        self.group_combo.addItem("월별 추이", 'month')
+
+        query_btn = QPushButton("조회")
+        query_btn.clicked.connect(self.run_query)
+
+        for widget in (self.name_input, self.rel_combo, self.dir_combo, self.group_combo, query_btn):
+            filter_layout.addWidget(widget)
+        layout.addLayout(filter_layout)
+
+        self.table = QTableWidget()
+        self.table.setEditTriggers(QTableWidget.EditTrigger.NoEditTriggers)
+        self.table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeMode.Stretch)
+        layout.addWidget(self.table)
+
+        bottom_layout = QHBoxLayout()
+        self.summary_label = QLabel()
+        csv_btn = QPushButton("CSV로 저장")
+        csv_btn.clicked.connect(self.export_csv)
+        bottom_layout.addWidget(self.summary_label)
+        bottom_layout.addStretch()
+        bottom_layout.addWidget(csv_btn)
+        layout.addLayout(bottom_layout)
+
+        self.run_query()
+
+    def run_query(self):
+        self.header, self.rows = self.db.relation_stats(
+            self.group_combo.currentData(), self.name_input.text().strip(),
+            self.rel_combo.currentData(), self.dir_combo.currentData())
+
+        self.table.setRowCount(len(self.rows))
+        self.table.setColumnCount(len(self.header))
+        self.table.setHorizontalHeaderLabels([self.HEADER_LABELS[h] for h in self.header])
+        for r, row in enumerate(self.rows):
+            for c, value in enumerate(row):
+                self.table.setItem(r, c, QTableWidgetItem("" if value is None else str(value)))
+        self.summary_label.setText(f"{len(self.rows)}개 항목")
+
+    def export_csv(self):
+        file_path, _ = QFileDialog.getSaveFileName(self, "CSV 저장", "ecomap_stats.csv", "CSV Files (*.csv)")
+        if not file_path:
+            return
+        # 엑셀에서 한글이 깨지지 않도록 BOM 포함
+        try:
+            with open(file_path, 'w', newline='', encoding='utf-8-sig') as f:
+                writer = csv.writer(f)
+                writer.writerow([self.HEADER_LABELS[h] for h in self.header])
+                writer.writerows(self.rows)
+        except OSError as e:
+            # 엑셀에서 열려 있는 파일 등
+            QMessageBox.critical(self, "오류", f"저장 실패: {e}")
+            return
+        QMessageBox.information(self, "저장 완료", "통계가 저장되었습니다.")
+
+# --- 끌어서 파일로 내보내는 버튼 ---
+# 클릭하면 평소처럼 clicked, 끌면 make_file()이 만든 파일을 탐색기 등으로 끌어다 놓을 수 있음
+class FileDragButton(QPushButton):
+    def __init__(self, text, make_file, parent=None):
+        super().__init__(text, parent)
+        self.make_file = make_file # 파일 경로 또는 None 반환
+        self.press_pos = None
+
+    def mousePressEvent(self, event):
+        if event.button() == Qt.MouseButton.LeftButton:
+            self.press_pos = event.position().toPoint()
+        super().mousePressEvent(event)
+
+    def mouseMoveEvent(self, event):
+        if (self.press_pos is None or
+                (event.position().toPoint() - self.press_pos).manhattanLength() < QApplication.startDragDistance()):
+            super().mouseMoveEvent(event)
+            return
+        self.press_pos = None
+        self.setDown(False) # 끌기로 바뀌었으므로 클릭으로 처리하지 않음
+        file_path = self.make_file()
+        if not file_path:
+            return
+        mime = QMimeData()
+        mime.setUrls([QUrl.fromLocalFile(file_path)])
+        drag = QDrag(self)
+        drag.setMimeData(mime)
+        drag.exec(Qt.DropAction.CopyAction)
 
 # --- 메인 윈도우 ---
 class EcomapApp(QMainWindow):
+    # 생태도 변경 알림: (종류, 관련 노드 목록)
+    # 종류: 'moved', 'added', 'removed', 'renamed', 'restyled', 'reset'(전체가 바뀜, 목록은 비어 있음)
+    map_changed = pyqtSignal(str, list)
+
     def __init__(self):
         super().__init__()
         self.db = EcomapDB()
-        self.setWindowTitle("생태도 그리기 (Desktop Version)")
+        self.setWindowTitle("생태도 그리기 (Desktop Version)[*]") # [*]: 저장하지 않은 변경 표시
         self.resize(1200, 800)
         self.setStyleSheet(f"background-color: {CONSTANTS['BG_COLOR']}; font-family: {CONSTANTS['FONT_FAMILY']};")
 
         self.client_node = None
-        self.people_nodes = []
-        self.link_items = []
+        # 노드/링크 목록은 dict를 순서 있는 집합처럼 사용 (O(1) 추가·삭제)
+        self.people_nodes = {}
+        self.link_items = {}
+        self.layers = {}      # (관계, 방향) -> (링크 레이어, 노드 레이어)
+        self.name_index = {}  # 소문자 이름 -> 노드 집합 (dict)
+        self.search_matches = []
+        self.search_pos = -1
+        self.compact_render = False # 경량 렌더링 모드 (대용량 생태도용)
+        self.export_dpi = CONSTANTS['EXPORT_DPI']
+        self.export_thread = None
+        self.export_worker = None
+        self.export_progress = None
         
         # Undo/Redo 관련
         self.history = []
         self.history_index = -1
         self.is_undoing = False # Undo/Redo 중 이벤트 루프 방지
 
+        # 편집 트랜잭션 (begin_edit/commit_edit 사이의 변경은 하나의 히스토리 항목)
+        self.edit_depth = 0
+        self.edit_kind = None
+        self.edit_key = None
+        self.edit_start_state = None
+        self.rename_open = False
+        self.rename_timer = QTimer(self)
+        self.rename_timer.setSingleShot(True)
+        self.rename_timer.setInterval(CONSTANTS['RENAME_DEBOUNCE_MS'])
+        self.rename_timer.timeout.connect(self.flush_rename)
+
+        # 나눠서 불러오기 (큰 생태도)
+        self.is_loading = False
+        self.load_people = None    # 아직 추가하지 않은 인물 반복자
+        self.load_done_count = 0
+        self.load_finished = None  # 완료 시 호출
+        self.load_backup = None    # 취소 시 되돌릴 (상태, 히스토리, 인덱스, 제목)
+        self.load_timer = QTimer(self)
+        self.load_timer.setInterval(0) # 이벤트 처리 후 바로 다음 조각 실행
+        self.load_timer.timeout.connect(self.populate_step)
+
+        # 변경 추적 (저장/종료 확인/자동 저장은 바뀐 내용이 있을 때만 동작)
+        self.pending_changes = {} # 종류 -> 노드 집합 (dict), 히스토리에 기록될 때 알림
+        self.dirty = False        # 마지막 저장/불러오기 이후 변경 알림이 있었는지
+        self.clean_state = None   # 마지막으로 저장/불러온 상태 (되돌려서 같아지면 변경 없음)
+        self.saved_maps = {}      # 제목 -> 이 세션에서 DB와 같다고 확인된 스냅샷
+        self.current_map_title = None # 지금 캔버스를 마지막으로 불러오거나 저장한 DB 제목 (자동 저장 대상)
+        self.map_changed.connect(self.on_map_changed)
+        self.autosave_timer = QTimer(self)
+        self.autosave_timer.setInterval(CONSTANTS['AUTOSAVE_SECONDS'] * 1000)
+        self.autosave_timer.timeout.connect(self.autosave)
+
         self.init_ui()
 
     def init_ui(self):
@@ -434,6 +1460,54 @@ class EcomapApp(QMainWindow):
         add_btn.clicked.connect(self.add_person)
         left_layout.addWidget(add_btn)
 
+        # 여러 명 추가 / 선택 항목 일괄 변경
+        bulk_btn_layout = QHBoxLayout()
+        bulk_add_btn = QPushButton("여러 명 추가")
+        self.style_button(bulk_add_btn, "secondary")
+        bulk_add_btn.clicked.connect(self.add_people_bulk)
+
+        restyle_btn = QPushButton("선택 항목에 관계 적용")
+        self.style_button(restyle_btn, "secondary")
+        restyle_btn.clicked.connect(self.restyle_selected)
+
+        bulk_btn_layout.addWidget(bulk_add_btn)
+        bulk_btn_layout.addWidget(restyle_btn)
+        left_layout.addLayout(bulk_btn_layout)
+
+        left_layout.addWidget(self.create_h_line())
+
+        # 보기 설정 (관계/방향 레이어, 이름 찾기)
+        view_title = QLabel("보기 설정")
+        view_title.setStyleSheet("font-size: 14px; font-weight: bold;")
+        left_layout.addWidget(view_title)
+
+        self.rel_checks = {}
+        rel_check_layout = QHBoxLayout()
+        for rel, label in (('good', "좋은"), ('distant', "소원한"), ('conflict', "갈등")):
+            check = QCheckBox(label)
+            check.setChecked(True)
+            check.toggled.connect(self.update_layer_visibility)
+            rel_check_layout.addWidget(check)
+            self.rel_checks[rel] = check
+        left_layout.addLayout(rel_check_layout)
+
+        self.dir_checks = {}
+        dir_check_layout = QHBoxLayout()
+        for d, label in (('both', "양방향"), ('from', "나감"), ('to', "들어옴")):
+            check = QCheckBox(label)
+            check.setChecked(True)
+            check.toggled.connect(self.update_layer_visibility)
+            dir_check_layout.addWidget(check)
+            self.dir_checks[d] = check
+        left_layout.addLayout(dir_check_layout)
+
+        self.search_input = QLineEdit()
+        self.search_input.setPlaceholderText("이름 찾기 (Enter: 다음 항목)")
+        self.style_input(self.search_input)
+        self.search_input.textChanged.connect(self.highlight_matches)
+        self.search_input.returnPressed.connect(self.jump_to_next_match)
+        left_layout.addWidget(self.search_input)
+
         # 3. 생태도 목록
         list_label = QLabel("내 생태도 목록")
         list_label.setStyleSheet("font-size: 14px; font-weight: bold; margin-top: 10px;")
@@ -479,6 +1553,16 @@ class EcomapApp(QMainWindow):
         self.style_button(export_btn, "secondary")
         export_btn.clicked.connect(self.export_image)
 
+        # .ecomap 파일 (다른 사람과 생태도 한 개를 주고받을 때)
+        open_file_btn = QPushButton("파일 열기")
+        self.style_button(open_file_btn, "secondary")
+        open_file_btn.clicked.connect(lambda: self.open_ecomap_file())
+
+        save_file_btn = FileDragButton("파일로 저장", self.drag_ecomap_file)
+        self.style_button(save_file_btn, "secondary")
+        save_file_btn.setToolTip("클릭: .ecomap 파일로 저장 / 끌기: 폴더나 메신저 창에 바로 놓기")
+        save_file_btn.clicked.connect(self.save_ecomap_file)
+
         # Undo/Redo 버튼
         self.undo_btn = QPushButton("실행 취소")
         self.style_button(self.undo_btn, "secondary")
@@ -495,21 +1579,75 @@ class EcomapApp(QMainWindow):
         toolbar.addWidget(self.undo_btn)
         toolbar.addWidget(self.redo_btn)
         toolbar.addWidget(export_btn)
+        toolbar.addWidget(open_file_btn)
+        toolbar.addWidget(save_file_btn)
+
+        stats_btn = QPushButton("통계")
+        self.style_button(stats_btn, "secondary")
+        stats_btn.clicked.connect(self.show_analytics)
+        toolbar.addWidget(stats_btn)
         toolbar.addStretch()
+
+        # 불러오기 진행 표시 (나눠서 불러올 때만 보임)
+        self.load_progress = QProgressBar()
+        self.load_progress.setFixedWidth(160)
+        self.load_progress.setFormat("불러오는 중 %p%")
+        self.load_progress.hide()
+        self.load_cancel_btn = QPushButton("취소")
+        self.style_button(self.load_cancel_btn, "secondary")
+        self.load_cancel_btn.clicked.connect(self.cancel_loading)
+        self.load_cancel_btn.hide()
+        toolbar.addWidget(self.load_progress)
+        toolbar.addWidget(self.load_cancel_btn)
+
+        self.compact_check = QCheckBox("경량 렌더링")
+        self.compact_check.setToolTip("노드가 많은 생태도에서 메모리 사용량을 줄입니다.")
+        self.compact_check.toggled.connect(self.set_compact_render)
+        toolbar.addWidget(self.compact_check)
+
+        self.theme_combo = QComboBox()
+        for name, theme in THEMES.items():
+            self.theme_combo.addItem(theme['label'], name)
+        self.theme_combo.setToolTip("캔버스 테마 (이미지 저장에도 적용)")
+        self.theme_combo.currentIndexChanged.connect(
+            lambda i: self.apply_theme(self.theme_combo.itemData(i)))
+        toolbar.addWidget(self.theme_combo)
+
+        self.autosave_check = QCheckBox("자동 저장")
+        self.autosave_check.setToolTip(f"{CONSTANTS['AUTOSAVE_SECONDS']}초마다 바뀐 내용이 있으면 DB에 저장합니다.")
+        self.autosave_check.toggled.connect(self.set_autosave)
+        toolbar.addWidget(self.autosave_check)
         right_layout.addLayout(toolbar)
 
         # 그래픽 뷰 (캔버스)
         self.scene = QGraphicsScene()
         self.scene.setSceneRect(0, 0, 800, 600) # 초기 크기
+        self.scene.setBackgroundBrush(STYLES.canvas_brush())
         
         self.view = QGraphicsView(self.scene)
         self.view.setRenderHint(QPainter.RenderHint.Antialiasing)
-        self.view.setDragMode(QGraphicsView.DragMode.NoDrag) # 아이템 드래그를 위해 뷰 드래그 꺼둠
+        # 빈 곳을 드래그하면 사각형으로 여러 노드 선택 (노드 위에서는 기존처럼 이동)
+        self.view.setDragMode(QGraphicsView.DragMode.RubberBandDrag)
         self.view.setStyleSheet("border: none;")
+        # .ecomap 파일을 캔버스에 끌어다 놓으면 창(dropEvent)에서 열도록 뷰는 드롭을 받지 않음
+        self.view.setAcceptDrops(False)
+        self.view.viewport().setAcceptDrops(False)
+        self.setAcceptDrops(True)
         right_layout.addWidget(self.view)
+
+        # 방향키로 선택 노드 이동 (캔버스에 포커스가 있을 때만, Shift는 크게 이동)
+        step = CONSTANTS['NUDGE_STEP']
+        for key, dx, dy in ((Qt.Key.Key_Left, -1, 0), (Qt.Key.Key_Right, 1, 0),
+                            (Qt.Key.Key_Up, 0, -1), (Qt.Key.Key_Down, 0, 1)):
+            for modifier, factor in ((Qt.KeyboardModifier.NoModifier, 1),
+                                     (Qt.KeyboardModifier.ShiftModifier, 4)):
+                shortcut = QShortcut(QKeySequence(modifier.value | key.value), self.view)
+                shortcut.setContext(Qt.ShortcutContext.WidgetShortcut)
+                shortcut.activated.connect(
+                    lambda dx=dx * step * factor, dy=dy * step * factor: self.nudge_selected(dx, dy))
         
         # 캔버스 하단 설명
-        help_label = QLabel("노드를 드래그하여 이동 | Delete 키로 선택 노드 삭제")
+        help_label = QLabel("노드를 드래그하거나 방향키로 이동 | 빈 곳을 드래그하여 여러 개 선택 | Delete 키로 선택 노드 삭제")
         help_label.setStyleSheet("color: #777; font-size: 12px; margin-top: 5px;")
         help_label.setAlignment(Qt.AlignmentFlag.AlignRight)
         right_layout.addWidget(help_label)
@@ -528,6 +1666,7 @@ class EcomapApp(QMainWindow):
         self.refresh_map_list()
         self.reset_canvas() # 초기 캔버스 설정 (Client 생성 등)
         self.save_state_to_history() # 초기 상태 저장
+        self.mark_clean()
 
     # --- 스타일 헬퍼 함수 ---
     def style_input(self, widget):
@@ -567,21 +1706,140 @@ class EcomapApp(QMainWindow):
         line.setStyleSheet("border: none; border-top: 1px solid #eee; margin: 10px 0;")
         return line
 
-    # --- Undo/Redo 로직 ---
-    def save_state_to_history(self):
-        if self.is_undoing: return
-
-        # 현재 상태 스냅샷 생성
-        state = {
-            'client': {
-                'name': self.client_node.name if self.client_node else "",
-                'x': self.client_node.pos().x() if self.client_node else 0,
-                'y': self.client_node.pos().y() if self.client_node else 0
-            },
-            'people': []
-        }
+    # --- 아이템 생성 (렌더링 모드에 따라 클래스 선택) ---
+    def create_node(self, x, y, name, node_type, layer=None):
+        node_cls = CompactNodeItem if self.compact_render else NodeItem
+        node = node_cls(x, y, name, node_type, self.scene, self)
+        if layer is not None:
+            node.setParentItem(layer) # 레이어는 원점에 있으므로 좌표는 그대로
+        else:
+            self.scene.addItem(node)
+        return node
+
+    def create_link(self, source_node, target_node, relationship, direction, layer=None):
+        link_cls = CompactLinkItem if self.compact_render else LinkItem
+        link = link_cls(source_node, target_node, relationship, direction)
+        if layer is not None:
+            link.setParentItem(layer)
+        else:
+            self.scene.addItem(link)
+        self.link_items[link] = None
         
+        # 노드에 링크 정보 등록 (움직일 때 업데이트용)
+        source_node.add_link(link)
+        target_node.add_link(link)
+        return link
+
+    def create_person(self, x, y, name, rel, direction):
+        # 주변 인물 노드 + Client와의 링크를 관계 레이어에 생성하고 이름 색인에 등록
+        link_layer, node_layer = self.layers[(rel, direction)]
+        person_node = self.create_node(x, y, name, 'Person', node_layer)
+        self.people_nodes[person_node] = None
+        self.create_link(self.client_node, person_node, rel, direction, link_layer)
+        self.name_index.setdefault(name.casefold(), {})[person_node] = None
+        return person_node
+
+    def clear_scene(self):
+        self.scene.clear()
+        self.people_nodes = {}
+        self.link_items = {}
+        self.name_index = {}
+        self.search_matches = []
+        self.search_pos = -1
+
+        # 링크 레이어는 노드 레이어보다 아래에 그림
+        self.layers = {}
+        for rel in RELATIONSHIPS:
+            for d in DIRECTIONS:
+                link_layer, node_layer = LayerItem(-1), LayerItem(0)
+                self.scene.addItem(link_layer)
+                self.scene.addItem(node_layer)
+                self.layers[(rel, d)] = (link_layer, node_layer)
+        self.update_layer_visibility()
+
+    # --- 레이어/이름 찾기 ---
+    def update_layer_visibility(self):
+        # 레이어 단위로만 바꾸므로 아이템 수와 관계없이 9개 레이어만 처리
+        for (rel, d), layer_pair in self.layers.items():
+            visible = self.rel_checks[rel].isChecked() and self.dir_checks[d].isChecked()
+            for layer in layer_pair:
+                layer.setVisible(visible)
+
+    def highlight_matches(self, text):
+        self.scene.clearSelection()
+        query = text.strip().casefold()
+        self.search_matches = []
+        self.search_pos = -1
+        if not query:
+            return
+        # 이름 색인의 키(서로 다른 이름)만 검사
+        for key, nodes in self.name_index.items():
+            if query in key:
+                self.search_matches.extend(n for n in nodes if n.isVisible())
+        for node in self.search_matches:
+            node.setSelected(True)
+        self.jump_to_next_match()
+
+    def jump_to_next_match(self):
+        if not self.search_matches:
+            return
+        self.search_pos = (self.search_pos + 1) % len(self.search_matches)
+        self.view.centerOn(self.search_matches[self.search_pos])
+
+    def move_to_layer(self, person_node, link):
+        link_layer, node_layer = self.layers[(link.relationship, link.direction)]
+        link.setParentItem(link_layer)
+        person_node.setParentItem(node_layer)
+
+    def set_compact_render(self, enabled):
+        if enabled == self.compact_render:
+            return
+        if self.is_loading:
+            # 불러오는 중에는 장면을 다시 만들 수 없음 (체크 상태만 되돌림)
+            self.compact_check.blockSignals(True)
+            self.compact_check.setChecked(self.compact_render)
+            self.compact_check.blockSignals(False)
+            return
+        # 현재 상태를 그대로 유지한 채 아이템만 새 모드로 다시 생성
+        self.flush_rename()
+        state = self.capture_state()
+        self.compact_render = enabled
+        # 긴 링크가 많으면 BSP 인덱스가 아이템을 여러 칸에 중복 저장하므로 인덱스를 끔
+        if enabled:
+            self.scene.setItemIndexMethod(QGraphicsScene.ItemIndexMethod.NoIndex)
+        else:
+            self.scene.setItemIndexMethod(QGraphicsScene.ItemIndexMethod.BspTreeIndex)
+        self.restore_state(state)
+
+    def apply_theme(self, theme):
+        if theme == STYLES.theme:
+            return
+        STYLES.set_theme(theme)
+        # 아이템을 다시 만들지 않고 한 번 순회하며 공유 스타일만 바꿔 끼움
+        self.scene.setBackgroundBrush(STYLES.canvas_brush())
+        if self.client_node:
+            self.client_node.refresh_style()
+        for node in self.people_nodes:
+            node.refresh_style()
+        for link in self.link_items:
+            link.update_style()
+
+    # --- Undo/Redo 로직 ---
+    def capture_state(self, visible_only=False):
+        # 현재 상태 스냅샷 생성 (직전 히스토리와 바뀌지 않은 부분은 공유)
+        # visible_only: 숨긴 레이어의 인물은 제외 (이미지 저장용)
+        previous = self.history[self.history_index].state if self.history_index >= 0 else None
+        if self.client_node:
+            client_pos = self.client_node.pos()
+            client = (self.client_node.name, client_pos.x(), client_pos.y())
+        else:
+            client = ("", 0, 0)
+        return MapSnapshot.build(*client, self.iter_people_data(visible_only), previous)
+
+    def iter_people_data(self, visible_only=False):
         for p_node in self.people_nodes:
+            if visible_only and not p_node.isVisible():
+                continue
             # 해당 노드와 Client를 잇는 링크 찾기
             related_link = None
             for link in p_node.links:
@@ -590,68 +1848,246 @@ class EcomapApp(QMainWindow):
                     break
             
             if related_link:
-                state['people'].append({
-                    'name': p_node.name,
-                    'x': p_node.pos().x(),
-                    'y': p_node.pos().y(),
-                    'relationship': related_link.relationship,
-                    'direction': related_link.direction
-                })
+                pos = p_node.pos()
+                yield (p_node.name, pos.x(), pos.y(),
+                       related_link.relationship, related_link.direction)
+
+    def save_state_to_history(self, kind='edit', key=None):
+        if self.is_undoing or self.is_loading: return
+        # 트랜잭션 중이면 commit_edit에서 한 번에 기록
+        if self.edit_depth: return
+
+        state = self.capture_state()
+        now = time.monotonic()
+        last = self.history[self.history_index] if self.history_index >= 0 else None
+
+        if last is not None and state == last.state:
+            self.pending_changes = {}
+            return # 바뀐 내용이 없으면 기록하지 않음
 
         # 히스토리 관리 (현재 인덱스 뒤의 기록은 날림)
-        self.history = self.history[:self.history_index + 1]
-        self.history.append(state)
-        self.history_index += 1
+        del self.history[self.history_index + 1:]
+        if (last is not None and self.history_index > 0 and kind in MERGEABLE_EDITS and
+                last.kind == kind and last.key == key and
+                now - last.time < CONSTANTS['UNDO_MERGE_SECONDS']):
+            # 같은 종류의 연속 편집은 마지막 항목을 덮어씀
+            self.history[self.history_index] = HistoryEntry(state, kind, key, now)
+        else:
+            self.history.append(HistoryEntry(state, kind, key, now))
+            self.history_index += 1
         
         self.update_undo_redo_buttons()
+        self.emit_changes()
+
+    # --- 편집 트랜잭션 ---
+    def begin_edit(self, kind, key=None):
+        if kind != 'rename':
+            self.flush_rename() # 입력 중이던 이름 변경을 먼저 기록
+        if self.edit_depth == 0:
+            self.edit_kind = kind
+            self.edit_key = key
+            self.edit_start_state = (self.history[self.history_index].state
+                                     if self.history_index >= 0 else self.capture_state())
+        self.edit_depth += 1
+
+    def commit_edit(self):
+        if self.edit_depth == 0:
+            return
+        self.edit_depth -= 1
+        if self.edit_depth == 0:
+            self.save_state_to_history(self.edit_kind, self.edit_key)
+            self.edit_start_state = None
+
+    def abort_edit(self):
+        # 트랜잭션 시작 전 상태로 되돌림 (기록하지 않음)
+        if self.edit_depth == 0:
+            return
+        state = self.edit_start_state
+        self.discard_edit()
+        self.restore_state(state)
+
+    def discard_edit(self):
+        # 열린 트랜잭션을 기록 없이 닫음
+        # 장면을 다시 구성하면 트랜잭션을 연 아이템(예: 드래그 중인 노드)이 사라져 commit_edit이 호출되지 않음
+        self.edit_depth = 0
+        self.edit_kind = None
+        self.edit_key = None
+        self.edit_start_state = None
+        self.rename_open = False
+        self.rename_timer.stop()
+        self.pending_changes = {}
+
+    def flush_rename(self):
+        # 디바운스 중인 이름 변경 트랜잭션을 마무리
+        self.rename_timer.stop()
+        if self.rename_open:
+            self.rename_open = False
+            self.commit_edit()
+
+    # --- 변경 추적 ---
+    def note_change(self, kind, node):
+        # 편집 중 바뀐 노드를 모아 두었다가 히스토리에 기록될 때 한 번에 알림
+        if self.is_undoing:
+            return
+        if self.is_loading:
+            self.dirty = True # 불러오는 중 편집 (히스토리는 불러오기가 끝난 뒤 기록)
+            return
+        self.pending_changes.setdefault(kind, {})[node] = None
+
+    def emit_changes(self):
+        pending = self.pending_changes
+        self.pending_changes = {}
+        if not pending:
+            self.map_changed.emit('reset', [])
+        for kind, nodes in pending.items():
+            self.map_changed.emit(kind, list(nodes))
+
+    def on_map_changed(self, kind, nodes):
+        self.dirty = True
+        self.setWindowModified(True)
+
+    def current_state(self):
+        # 히스토리에 기록된 최신 상태 (불러오는 중에는 화면에서 새로 만듦)
+        self.flush_rename()
+        if self.is_loading or self.history_index < 0:
+            return self.capture_state()
+        return self.history[self.history_index].state
+
+    def mark_clean(self, title=None, state=None):
+        # 현재 상태를 저장된 상태로 표시 (title이 있으면 DB 내용과 같은 것으로 기억)
+        # title이 없으면(새 캔버스, 파일에서 열기) 직접 저장하기 전까지 자동 저장하지 않음
+        if state is None:
+            state = self.current_state()
+        self.clean_state = state
+        self.current_map_title = title or None
+        if title:
+            self.saved_maps[title] = state
+        self.dirty = False
+        self.setWindowModified(False)
+
+    def is_dirty(self):
+        if not self.dirty:
+            return False
+        # 실행 취소 등으로 저장된 상태와 같아졌으면 변경 없음으로 처리
+        if (self.clean_state is not None and not self.is_loading and
+                self.current_state().content_hash() == self.clean_state.content_hash()):
+            self.dirty = False
+            self.setWindowModified(False)
+            return False
+        return True
 
     def update_undo_redo_buttons(self):
-        self.undo_btn.setEnabled(self.history_index > 0)
-        self.redo_btn.setEnabled(self.history_index < len(self.history) - 1)
+        self.undo_btn.setEnabled(not self.is_loading and self.history_index > 0)
+        self.redo_btn.setEnabled(not self.is_loading and self.history_index < len(self.history) - 1)
 
     def undo(self):
+        if self.is_loading: return # 불러오는 중에는 히스토리가 아직 이전 생태도 기준
+        self.flush_rename()
         if self.history_index > 0:
             self.history_index -= 1
-            self.restore_state(self.history[self.history_index])
+            self.restore_state(self.history[self.history_index].state)
             self.update_undo_redo_buttons()
+            self.map_changed.emit('reset', [])
 
     def redo(self):
+        if self.is_loading: return
+        self.flush_rename()
         if self.history_index < len(self.history) - 1:
             self.history_index += 1
-            self.restore_state(self.history[self.history_index])
+            self.restore_state(self.history[self.history_index].state)
             self.update_undo_redo_buttons()
+            self.map_changed.emit('reset', [])
 
     def restore_state(self, state):
+        self.start_population(state.client, len(state), state.iter_people())
+
+    # --- 장면 구성 (큰 생태도는 이벤트 루프에서 조금씩 추가) ---
+    def start_population(self, client, total, people, on_finished=None, cancellable=False):
+        # people: (이름, x, y, 관계, 방향) 반복자
+        self.stop_population()
+        self.discard_edit() # 호출한 쪽에서 필요한 기록(flush_rename 등)은 이미 마쳤음
+        if not cancellable:
+            self.load_backup = None # DB 불러오기가 아니면 되돌릴 상태 없음
         self.is_undoing = True
         
-        self.scene.clear()
-        self.people_nodes = []
-        self.link_items = []
+        self.clear_scene()
         
         # Client 복원
-        c_data = state['client']
+        c_name, c_x, c_y = client
         self.client_name_input.blockSignals(True) # 시그널 차단하여 무한 루프 방지
-        self.client_name_input.setText(c_data['name'])
+        self.client_name_input.setText(c_name)
         self.client_name_input.blockSignals(False)
         
-        self.client_node = NodeItem(c_data['x'], c_data['y'], c_data['name'], 'Client', self.scene, self)
-        self.scene.addItem(self.client_node)
-        
-        # People 복원
-        for p_data in state['people']:
-            p_node = NodeItem(p_data['x'], p_data['y'], p_data['name'], 'Person', self.scene, self)
-            self.scene.addItem(p_node)
-            self.people_nodes.append(p_node)
-            
-            link = LinkItem(self.client_node, p_node, p_data['relationship'], p_data['direction'])
-            self.scene.addItem(link)
-            self.link_items.append(link)
-            
-            self.client_node.add_link(link)
-            p_node.add_link(link)
-            
+        self.client_node = self.create_node(c_x, c_y, c_name, 'Client')
         self.is_undoing = False
 
+        if total <= CONSTANTS['PROGRESSIVE_LOAD_MIN']:
+            # 작은 생태도는 바로 모두 추가
+            for name, x, y, rel, direction in people:
+                self.create_person(x, y, name, rel, direction)
+            if on_finished:
+                on_finished()
+            return
+
+        # 이미 추가된 부분은 바로 보고 편집할 수 있음 (히스토리 기록은 완료 후)
+        self.is_loading = True
+        self.load_people = people
+        self.load_done_count = 0
+        self.load_finished = on_finished
+        self.load_progress.setRange(0, total)
+        self.load_progress.setValue(0)
+        self.load_progress.show()
+        self.load_cancel_btn.setVisible(cancellable)
+        self.compact_check.setEnabled(False)
+        self.update_undo_redo_buttons()
+        self.load_timer.start()
+
+    def populate_step(self):
+        deadline = time.perf_counter() + CONSTANTS['LOAD_SLICE_MS'] / 1000
+        for name, x, y, rel, direction in self.load_people:
+            self.create_person(x, y, name, rel, direction)
+            self.load_done_count += 1
+            if time.perf_counter() >= deadline:
+                self.load_progress.setValue(self.load_done_count)
+                return
+
+        # 모두 추가됨
+        on_finished = self.load_finished
+        self.stop_population()
+        if on_finished:
+            on_finished()
+        else:
+            # 실행 취소 등으로 복원하는 중 편집한 내용을 히스토리에 반영 (바뀐 것이 없으면 기록되지 않음)
+            self.save_state_to_history()
+
+    def stop_population(self):
+        self.load_timer.stop()
+        if self.load_people is not None and hasattr(self.load_people, 'close'):
+            self.load_people.close() # DB 커서 반복자 정리
+        self.load_people = None
+        self.load_finished = None
+        self.is_loading = False
+        self.load_progress.hide()
+        self.load_cancel_btn.hide()
+        self.compact_check.setEnabled(True)
+        self.update_undo_redo_buttons()
+
+    def cancel_loading(self):
+        # DB에서 불러오던 중 취소하면 불러오기 전 상태로 되돌림
+        if not self.is_loading or self.load_backup is None:
+            return
+        state, history, history_index, title, clean_state, dirty = self.load_backup
+        self.load_backup = None
+        self.stop_population()
+        self.map_title_input.setText(title)
+        self.history = history
+        self.history_index = history_index
+        self.restore_state(state)
+        self.update_undo_redo_buttons()
+        self.clean_state = clean_state
+        self.dirty = dirty
+        self.setWindowModified(dirty)
+
     # --- 기능 로직 ---
 
     def reset_canvas_with_confirm(self):
@@ -659,12 +2095,15 @@ class EcomapApp(QMainWindow):
                                 QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No) == QMessageBox.StandardButton.Yes:
             self.reset_canvas()
             self.save_state_to_history()
+            self.mark_clean()
 
     def reset_canvas(self):
-        self.scene.clear()
+        self.flush_rename()
+        self.discard_edit()
+        self.stop_population()
+        self.load_backup = None
+        self.clear_scene()
         self.client_node = None
-        self.people_nodes = []
-        self.link_items = []
         self.history = []
         self.history_index = -1
         
@@ -674,22 +2113,23 @@ class EcomapApp(QMainWindow):
         if rect.width() > 0: cx, cy = rect.width()/2, rect.height()/2
         
         initial_name = self.client_name_input.text() if self.client_name_input.text() else "Client"
-        self.client_node = NodeItem(cx, cy, initial_name, 'Client', self.scene, self)
-        self.scene.addItem(self.client_node)
+        self.client_node = self.create_node(cx, cy, initial_name, 'Client')
 
     def update_client_name(self, text):
-        if self.client_node and hasattr(self.client_node, 'text_item'):
+        if self.client_node:
             try:
-                self.client_node.name = text  # name 속성도 업데이트
-                self.client_node.text_item.setPlainText(text)
-                self.client_node.center_text()
+                self.client_node.set_name(text)  # name 속성과 라벨을 함께 업데이트
             except RuntimeError:
                 # text_item이 이미 삭제된 경우 (scene.clear() 후 등)
                 pass
             if not self.is_undoing:
-                # 타이핑할 때마다 저장하면 너무 많으므로, 포커스 아웃이나 엔터 처리 등이 좋지만
-                # 여기서는 간단히 처리 (실제로는 타이머 등을 사용해 디바운싱 권장)
-                pass 
+                self.note_change('renamed', self.client_node)
+                # 타이핑이 멈출 때까지 하나의 트랜잭션으로 묶고, 타이머가 끝나면 기록
+                if not self.rename_open and self.edit_depth == 0:
+                    self.begin_edit('rename')
+                    self.rename_open = True
+                if self.rename_open:
+                    self.rename_timer.start()
 
     def add_person(self):
         name = self.person_name_input.text()
@@ -702,6 +2142,17 @@ class EcomapApp(QMainWindow):
             return
 
         # 데이터 추출
+        rel, direction = self.current_rel_direction()
+        self.begin_edit('add')
+        self.add_person_node(name, rel, direction)
+
+        # 입력 초기화
+        self.person_name_input.clear()
+        
+        # 상태 저장
+        self.commit_edit()
+
+    def current_rel_direction(self):
         rel_text = self.rel_combo.currentText()
         if "good" in rel_text: rel = "good"
         elif "distant" in rel_text: rel = "distant"
@@ -711,7 +2162,10 @@ class EcomapApp(QMainWindow):
         if "both" in dir_text: direction = "both"
         elif "from" in dir_text: direction = "from"
         else: direction = "to"
+        return rel, direction
 
+    def add_person_node(self, name, rel, direction):
+        # 히스토리는 저장하지 않음 (호출한 쪽에서 한 번만 저장)
         # 위치 계산 (원형 배치)
         count = len(self.people_nodes)
         angle = count * 0.9  # 약간씩 각도를 틈
@@ -720,32 +2174,73 @@ class EcomapApp(QMainWindow):
         nx = cx + math.cos(angle) * radius
         ny = cy + math.sin(angle) * radius
 
-        # 노드 생성
-        person_node = NodeItem(nx, ny, name, 'Person', self.scene, self)
-        self.scene.addItem(person_node)
-        self.people_nodes.append(person_node)
+        # 노드 + 링크 생성 (노드에 링크 정보도 함께 등록)
+        person_node = self.create_person(nx, ny, name, rel, direction)
+        self.note_change('added', person_node)
+        return person_node
 
-        # 링크 생성
-        link = LinkItem(self.client_node, person_node, rel, direction)
-        self.scene.addItem(link)
-        self.link_items.append(link)
-        
-        # 노드에 링크 정보 등록 (움직일 때 업데이트용)
-        self.client_node.add_link(link)
-        person_node.add_link(link)
+    def add_people_bulk(self):
+        if not self.client_node:
+            QMessageBox.warning(self, "경고", "중심 인물이 없습니다.")
+            return
 
-        # 입력 초기화
-        self.person_name_input.clear()
-        
-        # 상태 저장
-        self.save_state_to_history()
+        text, ok = QInputDialog.getMultiLineText(
+            self, "여러 명 추가",
+            "한 줄에 한 명씩 입력하세요: 이름, 관계(good/distant/conflict), 방향(both/from/to)\n"
+            "관계·방향을 생략하면 현재 선택된 값이 사용됩니다.")
+        if not ok or not text.strip():
+            return
+
+        default_rel, default_dir = self.current_rel_direction()
+        people, errors = parse_people_lines(text, default_rel, default_dir)
+        if errors:
+            QMessageBox.warning(self, "입력 오류", "다음 줄을 확인해주세요.\n" + "\n".join(errors))
+            return
+
+        # 한 번의 실행 취소 단위
+        self.begin_edit('bulk_add')
+        try:
+            for name, rel, direction in people:
+                self.add_person_node(name, rel, direction)
+        except Exception:
+            self.abort_edit()
+            raise
+        self.commit_edit()
+
+    def nudge_selected(self, dx, dy):
+        nodes = [item for item in self.scene.selectedItems() if isinstance(item, NodeItem)]
+        if not nodes:
+            return
+        # 같은 노드들을 연속으로 움직이면 하나의 실행 취소 단위로 합쳐짐
+        self.begin_edit('nudge', frozenset(nodes))
+        for node in nodes:
+            node.moveBy(dx, dy)
+        self.commit_edit()
+
+    def restyle_selected(self):
+        rel, direction = self.current_rel_direction()
+        self.begin_edit('restyle')
+        for item in self.scene.selectedItems():
+            if not isinstance(item, NodeItem) or item.node_type == 'Client':
+                continue
+            for link in item.links:
+                if link.relationship == rel and link.direction == direction:
+                    continue
+                link.relationship = rel
+                link.direction = direction
+                link.update_style()
+                link.update_position()
+                self.move_to_layer(item, link)
+                self.note_change('restyled', item)
+
+        self.commit_edit() # 바뀐 것이 없으면 기록되지 않음
 
     def delete_selected_node(self):
         selected_items = self.scene.selectedItems()
         if not selected_items:
             return
             
-        changed = False
+        self.begin_edit('delete')
         for item in selected_items:
             if isinstance(item, NodeItem):
                 if item.node_type == 'Client':
@@ -753,24 +2248,21 @@ class EcomapApp(QMainWindow):
                     continue
                 
                 # 연결된 링크 삭제
-                for link in item.links[:]: # 복사본으로 순회
+                for link in list(item.links): # 복사본으로 순회
                     self.scene.removeItem(link)
-                    if link in self.link_items:
-                        self.link_items.remove(link)
+                    self.link_items.pop(link, None)
                     # 반대편 노드의 링크 목록에서도 제거
                     other = link.source if link.target == item else link.target
-                    if link in other.links:
-                        other.links.remove(link)
+                    other.remove_link(link)
                         
-                # 리스트에서 제거
-                if item in self.people_nodes:
-                    self.people_nodes.remove(item)
+                # 목록 및 이름 색인에서 제거
+                self.people_nodes.pop(item, None)
+                self.name_index.get(item.name.casefold(), {}).pop(item, None)
                 
                 self.scene.removeItem(item)
-                changed = True
+                self.note_change('removed', item)
         
-        if changed:
-            self.save_state_to_history()
+        self.commit_edit()
 
     def keyPressEvent(self, event):
         # Delete 키로 삭제 기능
@@ -785,6 +2277,12 @@ class EcomapApp(QMainWindow):
         super().keyPressEvent(event)
 
     def closeEvent(self, event):
+        if not self.is_dirty():
+            # 바뀐 내용이 없으면 묻지 않고 종료
+            self.stop_export()
+            event.accept()
+            return
+
         reply = QMessageBox.question(self, '종료 확인',
                                      "변경사항을 저장하시겠습니까?",
                                      QMessageBox.StandardButton.Yes | 
@@ -794,60 +2292,91 @@ class EcomapApp(QMainWindow):
 
         if reply == QMessageBox.StandardButton.Yes:
             if self.save_to_db():
+                self.stop_export()
                 event.accept()
             else:
                 event.ignore()
         elif reply == QMessageBox.StandardButton.No:
+            self.stop_export()
             event.accept()
         else:
             event.ignore()
 
     # --- 데이터베이스 연동 ---
     def save_to_db(self):
+        if self.is_loading:
+            QMessageBox.warning(self, "불러오는 중", "생태도를 모두 불러온 뒤에 저장해주세요.")
+            return False
+
         title = self.map_title_input.text()
         if not title:
             QMessageBox.warning(self, "필수", "생태도 제목을 입력해주세요.")
             return False
 
-        client_data = {
-            'name': self.client_node.name if hasattr(self.client_node, 'name') else self.client_name_input.text(),
-            'x': self.client_node.pos().x(),
-            'y': self.client_node.pos().y()
-        }
-
-        people_data = []
-        # 링크 정보를 기반으로 관계 데이터 찾기 (약간 비효율적이지만 정확함)
-        for p_node in self.people_nodes:
-            # 해당 노드와 Client를 잇는 링크 찾기
-            related_link = None
-            for link in p_node.links:
-                if link.source == self.client_node or link.target == self.client_node:
-                    related_link = link
-                    break
-            
-            if related_link:
-                people_data.append({
-                    'name': p_node.name,
-                    'x': p_node.pos().x(),
-                    'y': p_node.pos().y(),
-                    'relationship': related_link.relationship,
-                    'direction': related_link.direction
-                })
-
-        success, msg = self.db.save_map(title, client_data, people_data)
+        success, msg = self.write_map(title)
         if success:
             QMessageBox.information(self, "성공", msg)
-            self.refresh_map_list()
             return True
         else:
             QMessageBox.critical(self, "오류", f"저장 실패: {msg}")
             return False
 
+    def write_map(self, title):
+        # 히스토리와 같은 스냅샷 형식으로 저장 (DB와 같으면 쓰지 않고, 좌표만 바뀌었으면 그 행만 갱신)
+        snapshot = self.current_state()
+        saved = self.saved_maps.get(title)
+        if saved is not None and saved.content_hash() == snapshot.content_hash():
+            self.mark_clean(title, snapshot)
+            return True, "바뀐 내용이 없습니다."
+
+        moved = snapshot.moved_since(saved) if saved is not None else None
+        if moved is not None:
+            success, msg = self.db.update_positions(title, moved)
+        else:
+            success, msg = self.db.save_snapshot(title, snapshot)
+        if success:
+            self.mark_clean(title, snapshot)
+            self.move_map_to_top(title)
+        return success, msg
+
+    def set_autosave(self, enabled):
+        if enabled:
+            self.autosave_timer.start()
+        else:
+            self.autosave_timer.stop()
+
+    def autosave(self):
+        # 마지막으로 불러오거나 저장한 생태도에만 저장
+        # (제목란은 목록을 클릭하기만 해도 바뀌므로, 다르면 직접 저장할 때까지 건너뜀)
+        title = self.current_map_title
+        if (not title or self.map_title_input.text() != title or
+                self.is_loading or self.edit_depth or not self.is_dirty()):
+            return
+        success, msg = self.write_map(title)
+        if not success:
+            self.autosave_check.setChecked(False)
+            QMessageBox.critical(self, "오류", f"자동 저장 실패: {msg}\n자동 저장을 껐습니다.")
+
+    def move_map_to_top(self, title):
+        # 목록 전체를 다시 읽지 않고 저장한 항목만 맨 위로 (목록은 최근 저장 순)
+        found = self.map_list_widget.findItems(title, Qt.MatchFlag.MatchExactly)
+        if found:
+            row = self.map_list_widget.row(found[0])
+            if row == 0:
+                return
+            item = self.map_list_widget.takeItem(row)
+            self.map_list_widget.insertItem(0, item)
+        else:
+            self.map_list_widget.insertItem(0, title)
+
     def refresh_map_list(self):
         self.map_list_widget.clear()
         maps = self.db.get_map_list()
         self.map_list_widget.addItems(maps)
 
+    def show_analytics(self):
+        AnalyticsDialog(self.db, self).exec()
+
     def on_list_item_clicked(self, item):
         self.map_title_input.setText(item.text())
 
@@ -858,48 +2387,47 @@ class EcomapApp(QMainWindow):
             return
         
         map_name = current_item.text()
-        data = self.db.load_map(map_name)
+        try:
+            opened = self.db.open_map(map_name)
+        except ValueError as e:
+            # Client 데이터가 없는 경우
+            QMessageBox.critical(self, "오류", str(e))
+            return
         
-        if not data:
+        if not opened:
             QMessageBox.critical(self, "오류", "데이터를 불러오지 못했습니다.")
             return
 
-        # Client 데이터 확인
-        c_data = data['client']
-        if not c_data:
-            QMessageBox.critical(self, "오류", "생태도에 중심 인물 데이터가 없습니다.")
-            return
-
-        # 캔버스 리셋 및 데이터 적용
-        self.scene.clear()
-        self.people_nodes = []
-        self.link_items = []
+        client, total, people = opened
+        self.start_map_load(map_name, client, total, people,
+                            on_finished=lambda: self.finish_loading(map_name, map_name))
+
+    def start_map_load(self, title, client, total, people, on_finished):
+        # 취소하면 되돌릴 수 있도록 현재 상태 보관
+        self.flush_rename()
+        if self.load_backup is None:
+            self.load_backup = (self.capture_state(), self.history, self.history_index,
+                                self.map_title_input.text(), self.clean_state, self.dirty)
+        self.dirty = False # 불러오는 중 편집하면 다시 설정됨
+
+        # 캔버스 리셋 및 데이터 적용 (Client 이름 입력란도 갱신)
+        self.map_title_input.setText(title)
+        self.start_population(client, total, people, on_finished=on_finished, cancellable=True)
+
+    def finish_loading(self, map_name, db_title=None):
+        # db_title: DB에서 불러왔으면 그 제목 (DB 내용과 같은 상태로 기억)
+        self.load_backup = None
         self.history = []
         self.history_index = -1
-        
-        # Client 생성 (시그널 차단하여 update_client_name 호출 방지)
-        self.client_name_input.blockSignals(True)
-        self.client_name_input.setText(c_data['name'])
-        self.map_title_input.setText(map_name)
-        self.client_name_input.blockSignals(False)
-        
-        self.client_node = NodeItem(c_data['x'], c_data['y'], c_data['name'], 'Client', self.scene, self)
-        self.scene.addItem(self.client_node)
-        
-        # People 생성
-        for p_data in data['people']:
-            p_node = NodeItem(p_data['x'], p_data['y'], p_data['name'], 'Person', self.scene, self)
-            self.scene.addItem(p_node)
-            self.people_nodes.append(p_node)
-            
-            link = LinkItem(self.client_node, p_node, p_data['relationship'], p_data['direction'])
-            self.scene.addItem(link)
-            self.link_items.append(link)
-            
-            self.client_node.add_link(link)
-            p_node.add_link(link)
-            
+        edited = self.dirty # 불러오는 중 편집한 내용이 있는지
         self.save_state_to_history() # 로드 후 초기 상태 저장
+        if edited:
+            self.clean_state = None # DB와 다르므로 저장 전까지 변경 있음
+            self.current_map_title = db_title
+            self.dirty = True
+            self.setWindowModified(True)
+        else:
+            self.mark_clean(db_title)
         QMessageBox.information(self, "완료", f"'{map_name}'을(를) 불러왔습니다.")
 
     def delete_selected_map(self):
@@ -912,26 +2440,142 @@ class EcomapApp(QMainWindow):
         
         if ret == QMessageBox.StandardButton.Yes:
             self.db.delete_map(current_item.text())
+            self.saved_maps.pop(current_item.text(), None)
+            if current_item.text() == self.current_map_title:
+                self.current_map_title = None
             self.refresh_map_list()
             self.map_title_input.clear()
 
+    # --- .ecomap 파일 ---
+    def open_ecomap_file(self, file_path=None):
+        if not file_path:
+            file_path, _ = QFileDialog.getOpenFileName(self, "생태도 파일 열기", "", "Ecomap Files (*.ecomap)")
+            if not file_path:
+                return
+        try:
+            snapshot = read_ecomap_file(file_path)
+        except (OSError, ValueError) as e:
+            QMessageBox.critical(self, "오류", f"파일을 열 수 없습니다: {e}")
+            return
+
+        file_name = os.path.basename(file_path)
+        title = os.path.splitext(file_name)[0]
+        self.start_map_load(title, snapshot.client, len(snapshot), snapshot.iter_people(),
+                            on_finished=lambda: self.finish_loading(file_name))
+
+    def save_ecomap_file(self):
+        if self.is_loading:
+            QMessageBox.warning(self, "불러오는 중", "생태도를 모두 불러온 뒤에 저장해주세요.")
+            return
+        default_name = self.ecomap_file_name()
+        file_path, _ = QFileDialog.getSaveFileName(self, "생태도 파일로 저장", default_name,
+                                                   "Ecomap Files (*.ecomap)")
+        if not file_path:
+            return
+        if not file_path.lower().endswith('.ecomap'):
+            file_path += '.ecomap'
+        try:
+            write_ecomap_file(file_path, self.current_state())
+        except OSError as e:
+            QMessageBox.critical(self, "오류", f"저장 실패: {e}")
+            return
+        QMessageBox.information(self, "성공", "파일로 저장되었습니다.")
+
+    def ecomap_file_name(self):
+        # 제목에서 파일 이름에 쓸 수 없는 문자를 바꿈
+        title = self.map_title_input.text().strip() or "ecomap"
+        for ch in '\\/:*?"<>|':
+            title = title.replace(ch, '_')
+        return title + '.ecomap'
+
+    def drag_ecomap_file(self):
+        # 끌어서 내보낼 임시 파일 생성 (실패하면 None)
+        if self.is_loading:
+            return None
+        file_path = os.path.join(tempfile.gettempdir(), self.ecomap_file_name())
+        try:
+            write_ecomap_file(file_path, self.current_state())
+        except OSError as e:
+            QMessageBox.critical(self, "오류", f"파일을 만들 수 없습니다: {e}")
+            return None
+        return file_path
+
+    def dropped_ecomap_file(self, event):
+        if not event.mimeData().hasUrls():
+            return None
+        for url in event.mimeData().urls():
+            if url.isLocalFile() and url.toLocalFile().lower().endswith('.ecomap'):
+                return url.toLocalFile()
+        return None
+
+    def dragEnterEvent(self, event):
+        if self.dropped_ecomap_file(event):
+            event.acceptProposedAction()
+        else:
+            event.ignore()
+
+    def dropEvent(self, event):
+        file_path = self.dropped_ecomap_file(event)
+        if file_path:
+            event.acceptProposedAction()
+            self.open_ecomap_file(file_path)
+
     def export_image(self):
+        if self.export_thread is not None:
+            QMessageBox.warning(self, "저장 중", "이미지를 저장하는 중입니다. 잠시 후 다시 시도해주세요.")
+            return
+
         file_path, _ = QFileDialog.getSaveFileName(self, "이미지 저장", "ecomap.png", "PNG Files (*.png)")
-        if file_path:
-            # Scene 영역 계산
-            rect = self.scene.itemsBoundingRect()
-            rect.adjust(-50, -50, 50, 50) # 여백 추가
-            
-            image = QImage(rect.size().toSize(), QImage.Format.Format_ARGB32)
-            image.fill(Qt.GlobalColor.white)
-            
-            painter = QPainter(image)
-            painter.setRenderHint(QPainter.RenderHint.Antialiasing)
-            self.scene.render(painter, target=QRectF(image.rect()), source=rect)
-            painter.end()
-            
-            image.save(file_path)
+        if not file_path:
+            return
+
+        dpi, ok = QInputDialog.getInt(self, "해상도", "해상도(DPI)를 입력하세요 (96 = 화면 크기, 300 = 인쇄용)",
+                                      self.export_dpi, 72, 1200)
+        if not ok:
+            return
+        self.export_dpi = dpi
+
+        # 화면에 보이는 상태를 스냅샷으로 넘김 (저장 중에도 계속 편집 가능, 이미지 영역은 작업 스레드에서 계산)
+        self.export_worker = ExportWorker(file_path, self.capture_state(visible_only=True), dpi,
+                                          STYLES.palette())
+        self.export_thread = QThread(self)
+        self.export_worker.moveToThread(self.export_thread)
+        self.export_thread.started.connect(self.export_worker.run)
+        self.export_worker.finished.connect(self.on_export_finished)
+        # 스레드가 끝나면 작업 객체와 스레드 객체를 정리 (저장할 때마다 쌓이지 않도록)
+        self.export_thread.finished.connect(self.export_worker.deleteLater)
+        self.export_thread.finished.connect(self.export_thread.deleteLater)
+
+        self.export_progress = QProgressDialog("이미지 저장 중...", "취소", 0, 100, self)
+        self.export_progress.setWindowModality(Qt.WindowModality.NonModal)
+        self.export_progress.setMinimumDuration(300)
+        self.export_progress.setValue(0)
+        self.export_worker.progress.connect(self.export_progress.setValue)
+        # 작업 스레드는 run() 실행 중이므로 취소 플래그는 직접 설정
+        self.export_progress.canceled.connect(self.export_worker.cancel, Qt.ConnectionType.DirectConnection)
+
+        self.export_thread.start()
+
+    def on_export_finished(self, success, error):
+        self.export_progress.reset()
+        self.export_progress.deleteLater()
+        self.export_progress = None
+        self.export_thread.quit()
+        self.export_thread.wait()
+        self.export_thread = None
+        self.export_worker = None
+
+        if success:
             QMessageBox.information(self, "저장 완료", "이미지가 저장되었습니다.")
+        elif error:
+            QMessageBox.critical(self, "오류", f"이미지 저장 실패: {error}")
+
+    def stop_export(self):
+        # 종료 시 진행 중인 저장 작업 취소
+        if self.export_thread is not None:
+            self.export_worker.cancel()
+            self.export_thread.quit()
+            self.export_thread.wait()
 
 if __name__ == '__main__':
     app = QApplication(sys.argv)